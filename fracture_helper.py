@@ -10,10 +10,21 @@ bl_info = {
     "category": "Object"}
 
 import bpy
+import bgl
+import bmesh
 import math
+import os
 import random
+import shutil
+import subprocess
+import tempfile
+import time
+import zlib
+import numpy as np
 from bpy_extras import view3d_utils
 from mathutils import Vector, Matrix
+from mathutils.bvhtree import BVHTree
+from bpy.app.handlers import persistent
 
 
 # Pie Fracture
@@ -64,12 +75,23 @@ class FractureHelperPreferences(bpy.types.AddonPreferences):
         layout.prop(self, "use_pie_menu")
         
    
-def setup_particles(count=150):
-    ob = bpy.context.active_object
-    bpy.ops.object.particle_system_add()
+def helper_seed(scene, name):
+    """Seed for everything random in a helper, taken from the scene seed and a
+       stable name (not the helper's own, that gets .001 suffixes depending on the
+       file), so identical setups give identical shards"""
+    return (scene.fracture_seed + zlib.crc32(name.encode())) & 0x7fffffff
+
+def helper_random(scene, name):
+    return random.Random(helper_seed(scene, name))
+
+def setup_particles(count=150, ob=None, seed=0):
+    if ob is None:
+        ob = bpy.context.active_object
+    md = ob.modifiers.new(type='PARTICLE_SYSTEM', name='ParticleHelper')
     #make particle system settings here....
-    ob.particle_systems[0].name = "ParticleHelper"
-    psys = ob.particle_systems[0].settings
+    md.particle_system.name = "ParticleHelper"
+    md.particle_system.seed = seed
+    psys = md.particle_system.settings
     psys.count = count
     psys.frame_start = 1
     psys.frame_end = 1
@@ -85,6 +107,191 @@ def setup_particles(count=150):
     psys.distribution = 'RAND'
     psys.physics_type = 'NO'
     
+# per object BVH trees for mouse picking, keyed by object name
+# trees live in object space, so only a change of the (evaluated) mesh data
+# invalidates them, moving the object just moves its world bounds
+bvh_cache = {}
+
+def get_bounds(ob):
+    entry = bvh_cache.get(ob.name)
+    if entry is None:
+        #homogeneous bound box corners, for the vectorized broadphase
+        corners = np.ones((8, 4))
+        corners[:, :3] = [co[:] for co in ob.bound_box]
+        #the tree itself is only built once the ray reaches the bounds
+        entry = [None, corners]
+        bvh_cache[ob.name] = entry
+    return entry[1]
+
+def get_bvh(scene, ob):
+    get_bounds(ob)
+    entry = bvh_cache[ob.name]
+    if entry[0] is None:
+        entry[0] = BVHTree.FromObject(ob, scene, deform=True)
+    return entry[0]
+
+def ray_box_entries(origin, direction, ray_max, corners, matrices):
+    """Slab test of one ray against many boxes at once, corners (n, 8, 4) are
+       transformed by matrices (n, 4, 4) into world space first. Returns the entry
+       distance per box, inf where the ray misses the box"""
+    cos = np.einsum('nij,nkj->nki', matrices, corners)[:, :, :3]
+    bmin = cos.min(axis=1)
+    bmax = cos.max(axis=1)
+    origin = np.array(origin[:])
+    direction = np.array(direction[:])
+    with np.errstate(divide='ignore', invalid='ignore'):
+        t1 = (bmin - origin) / direction
+        t2 = (bmax - origin) / direction
+    #parallel axis: inside the slab means no restriction, outside means a miss
+    parallel = direction == 0.0
+    inside = (origin >= bmin) & (origin <= bmax)
+    t1 = np.where(parallel, np.where(inside, -np.inf, np.inf), t1)
+    t2 = np.where(parallel, np.inf, t2)
+    tnear = np.maximum(np.minimum(t1, t2).max(axis=1), 0.0)
+    tfar = np.minimum(np.maximum(t1, t2).min(axis=1), ray_max)
+    return np.where(tnear <= tfar, tnear, np.inf)
+
+# (object, matrix) pairs of dupli emitters for picking, keyed by emitter name,
+# together with the names of the instanced objects. Only valid for the frame
+# they were built on
+dupli_cache = {"frame": None, "items": {}}
+
+def get_duplis(scene, obj):
+    if dupli_cache["frame"] != scene.frame_current:
+        dupli_cache["frame"] = scene.frame_current
+        dupli_cache["items"].clear()
+
+    entry = dupli_cache["items"].get(obj.name)
+    if entry is None:
+        obj.dupli_list_create(scene)
+        items = [(dob.object, dob.matrix.copy()) for dob in obj.dupli_list if dob.object.type == 'MESH']
+        obj.dupli_list_clear()
+        entry = (items, {o.name for o, m in items})
+        dupli_cache["items"][obj.name] = entry
+    return entry[0]
+
+@persistent
+def fracture_scene_update(scene):
+    #coalesced time scale changes, see update_timescale
+    if timescale_pending["scene"] is not None and time.time() - timescale_pending["time"] >= timescale_delay:
+        apply_timescale(bpy.data.scenes.get(timescale_pending["scene"]), timescale_pending["value"])
+        timescale_pending["scene"] = None
+    
+    #one pass over the objects, the picking caches only live during a mouse based session
+    if bpy.data.objects.is_updated and (len(bvh_cache) > 0 or len(dupli_cache["items"]) > 0):
+        names = set()
+        moved = set()
+        changed = set()
+        for ob in bpy.data.objects:
+            names.add(ob.name)
+            if ob.is_updated_data:
+                changed.add(ob.name)
+            elif ob.is_updated:
+                moved.add(ob.name)
+        
+        #drop cached picking trees of objects whose mesh data changed (refracture, edits...)
+        for name in list(bvh_cache.keys()):
+            if name in changed or name not in names:
+                del bvh_cache[name]
+
+        #emitter moved or its particles / instanced objects changed
+        for name, (items, sources) in list(dupli_cache["items"].items()):
+            deps = sources.union({name})
+            if not deps.isdisjoint(changed) or not deps.isdisjoint(moved) or not deps.issubset(names):
+                del dupli_cache["items"][name]
+    
+    if bpy.data.objects.is_updated:
+        #simulations are added / changed on the active object, object add / remove
+        #is caught by the counts in get_timescale_targets
+        act = scene.objects.active
+        if act is not None and act.is_updated_data:
+            timescale_registry["targets"] = None
+
+@persistent
+def fracture_clear_caches(dummy):
+    #object pointers and names arent reliable anymore after undo or file load
+    bvh_cache.clear()
+    dupli_cache["frame"] = None
+    dupli_cache["items"].clear()
+    texture_pool.clear()
+    timescale_registry["targets"] = None
+    timescale_pending["scene"] = None
+
+def point_inside(tree, co, direction):
+    #odd number of surface crossings along the ray -> inside
+    hits = 0
+    for i in range(64):
+        loc, normal, index, dist = tree.ray_cast(co, direction)
+        if loc is None:
+            break
+        hits += 1
+        co = loc + direction * 1e-5
+    return hits % 2 == 1
+
+def sample_volume_points(ob, scene, count, seed=0):
+    """Rejection sample count points inside the evaluated mesh of ob, in object
+       space. Candidates are drawn in batches from the bounds, a candidate is
+       inside if a ray from it crosses the surface an odd number of times. The
+       mesh is evaluated here, so modifiers added just before (skin, solidify)
+       count. mathutils casts one ray at a time, so the test loops per candidate"""
+    me = ob.to_mesh(scene, True, 'PREVIEW')
+    verts = np.empty(len(me.vertices) * 3, dtype=np.float32)
+    me.vertices.foreach_get("co", verts)
+    verts = verts.reshape(-1, 3)
+    polys = [p.vertices[:] for p in me.polygons]
+    bpy.data.meshes.remove(me)
+    
+    if len(verts) == 0:
+        return np.empty((0, 3))
+    
+    tree = BVHTree.FromPolygons(verts.tolist(), polys)
+    lo = verts.min(axis=0)
+    hi = verts.max(axis=0)
+    rng = np.random.RandomState(seed)
+    #skewed, so rays rarely run exactly through edges or along faces
+    direction = Vector((1.0, 0.0123, 0.0071)).normalized()
+    
+    pts = np.empty((0, 3))
+    if len(polys) > 0:
+        for i in range(20):
+            if len(pts) >= count:
+                break
+            cand = rng.uniform(lo, hi, (max(count - len(pts), 16) * 2, 3))
+            inside = np.array([point_inside(tree, Vector(co), direction) for co in cand], dtype=bool)
+            pts = np.vstack((pts, cand[inside]))
+    
+    if len(pts) < count:
+        #open or flat meshes have (almost) no volume, fill up with surface points
+        cand = rng.uniform(lo, hi, (count - len(pts), 3))
+        if len(polys) > 0:
+            surf = [tree.find_nearest(Vector(co))[0] for co in cand]
+            surf = [co[:] for co in surf if co is not None]
+        else:
+            #no faces at all, take the vertices
+            surf = verts[rng.randint(0, len(verts), len(cand))]
+        if len(surf) > 0:
+            pts = np.vstack((pts, surf))
+    
+    return pts[:count]
+
+def make_point_helper(ob, scene, count, seed=0):
+    """Replace the helper geometry by count points sampled inside of it, so FM can
+       use them as extra vertices instead of evaluating a particle system"""
+    pts = sample_volume_points(ob, scene, count, seed)
+    
+    me = bpy.data.meshes.new(ob.name + "_points")
+    me.vertices.add(len(pts))
+    me.vertices.foreach_set("co", pts.astype(np.float32).ravel())
+    me.update()
+    
+    #skin or solidify modifiers were only needed to give the helper a volume
+    for md in list(ob.modifiers):
+        ob.modifiers.remove(md)
+    old = ob.data
+    ob.data = me
+    if old.users == 0:
+        bpy.data.meshes.remove(old)
+
 def raycast(context, event, ray_max=1000.0, group=None):
     """Run this function on left mouse, execute the ray cast"""
     # get the context arguments
@@ -99,8 +306,6 @@ def raycast(context, event, ray_max=1000.0, group=None):
     view_vector = view3d_utils.region_2d_to_vector_3d(region, rv3d, coord)
     ray_origin = view3d_utils.region_2d_to_origin_3d(region, rv3d, coord)
 
-    ray_target = ray_origin + (view_vector * ray_max)
-
     def visible_objects_and_duplis(group=None):
         """Loop over (object, matrix) pairs (mesh only)"""
 
@@ -114,54 +319,255 @@ def raycast(context, event, ray_max=1000.0, group=None):
                 yield (obj, obj.matrix_world.copy())
 
             if obj.dupli_type != 'NONE':
-                obj.dupli_list_create(scene)
-                for dob in obj.dupli_list:
-                    obj_dupli = dob.object
-                    if obj_dupli.type == 'MESH':
-                        yield (obj_dupli, dob.matrix.copy())
-
-            obj.dupli_list_clear()
+                for obj_dupli, matrix in get_duplis(scene, obj):
+                    yield (obj_dupli, matrix)
 
     def obj_ray_cast(obj, matrix):
-        """Wrapper for ray casting that moves the ray into object space"""
+        """Ray cast against the cached BVH tree, with the ray moved into object space"""
+
+        tree = get_bvh(scene, obj)
 
         # get the ray relative to the object
         matrix_inv = matrix.inverted()
         ray_origin_obj = matrix_inv * ray_origin
-        ray_target_obj = matrix_inv * ray_target
+        ray_direction_obj = matrix_inv.to_3x3() * view_vector
 
         # cast the ray
-        result, hit, normal, face_index = obj.ray_cast(ray_origin_obj, ray_target_obj)
+        hit, normal, face_index, dist = tree.ray_cast(ray_origin_obj, ray_direction_obj)
 
-        if face_index != -1:
+        if face_index is not None:
             return hit, normal, face_index
         else:
             return None, None, None
 
-    # cast rays and find the closest object
-    best_length_squared = ray_max * ray_max
-    best_obj = None
-
+    # broadphase, test the ray against all world bounds at once
+    candidates = []
     for obj, matrix in visible_objects_and_duplis(group=group):
         if obj.type == 'MESH':
-            hit, normal, face_index = obj_ray_cast(obj, matrix)
-            if hit is not None:
-                hit_world = matrix * hit
-                normal_world = matrix * normal
-                scene.cursor_location = hit_world
-                length_squared = (hit_world - ray_origin).length_squared
-                if length_squared < best_length_squared:
-                    best_length_squared = length_squared
-                    best_obj = obj
+            candidates.append((obj, matrix, get_bounds(obj)))
+
+    if not candidates:
+        return None, None
+
+    entries = ray_box_entries(ray_origin, view_vector, ray_max,
+                              np.array([c[2] for c in candidates]),
+                              np.array([c[1] for c in candidates]))
+
+    # cast rays front to back and find the closest object, a box entered
+    # behind the closest hit so far cant contain a closer hit
+    best_length = ray_max
+    best_obj = None
+
+    for i in np.argsort(entries):
+        if entries[i] >= best_length:
+            break
+        obj, matrix, corners = candidates[i]
+        hit, normal, face_index = obj_ray_cast(obj, matrix)
+        if hit is not None:
+            hit = matrix * hit
+            length = (hit - ray_origin).length
+            if length < best_length:
+                best_length = length
+                best_obj = obj
+                hit_world = hit
+                normal_world = (matrix.to_3x3().inverted().transposed() * normal).normalized()
 
     # now we have the object under the mouse cursor,
     # we could do lots of stuff but for the example just select.
     if best_obj is not None:
+        scene.cursor_location = hit_world
         best_obj.select = True
         context.scene.objects.active = best_obj
 
     return hit_world, normal_world
 
+def make_radial_helper(context, location, segments, rings, radius=0.15, step=0.1):
+    """Build the concentric circles of a radial mouse helper as one mesh, a circle
+       with radius and rings more circles each step further out"""
+    #same vertex layout as primitive_circle_add, which needs 3 vertices at least
+    segments = max(segments, 3)
+    radii = radius + step * np.arange(rings + 1)
+    phi = 2.0 * math.pi * np.arange(segments) / segments
+    
+    co = np.zeros((rings + 1, segments, 3), dtype=np.float32)
+    co[:, :, 0] = -radii[:, np.newaxis] * np.sin(phi)
+    co[:, :, 1] = radii[:, np.newaxis] * np.cos(phi)
+    
+    #each circle is a closed edge loop
+    start = np.arange(rings + 1)[:, np.newaxis] * segments
+    edges = np.empty((rings + 1, segments, 2), dtype=np.int32)
+    edges[:, :, 0] = start + np.arange(segments)
+    edges[:, :, 1] = start + (np.arange(segments) + 1) % segments
+    
+    me = bpy.data.meshes.new("Circle")
+    me.vertices.add(co.shape[0] * co.shape[1])
+    me.vertices.foreach_set("co", co.ravel())
+    me.edges.add(edges.shape[0] * edges.shape[1])
+    me.edges.foreach_set("vertices", edges.ravel())
+    me.update()
+    
+    ob = bpy.data.objects.new("Circle", me)
+    ob.location = location
+    link_new_helper(context, ob)
+    
+    return ob
+
+def make_uniform_helper(context, location, shape, custom=""):
+    """Create the helper object of uniform mouse fracture, a small cube, sphere or a
+       copy of the custom object. Returns None if the custom object doesnt exist"""
+    if shape == "Custom":
+        src = bpy.data.objects.get(custom)
+        if src is None:
+            return None
+        ob = src.copy()
+        if src.data is not None:
+            ob.data = src.data.copy()
+    else:
+        #same sizes as the cube and uv sphere primitives used to have here
+        bm = bmesh.new()
+        if shape == "Cube":
+            bmesh.ops.create_cube(bm, size=0.1)
+        else:
+            bmesh.ops.create_uvsphere(bm, u_segments=32, v_segments=16, diameter=0.05)
+        me = bpy.data.meshes.new(shape)
+        bm.to_mesh(me)
+        bm.free()
+        ob = bpy.data.objects.new(shape, me)
+    
+    ob.location = location
+    link_new_helper(context, ob)
+    
+    return ob
+
+def link_new_helper(context, ob):
+    context.scene.objects.link(ob)
+    ob.layers = [x == context.scene.active_layer for x in range(20)]
+    
+    #leave selection as the primitive operators would
+    for o in context.selected_objects:
+        o.select = False
+    ob.select = True
+    context.scene.objects.active = ob
+
+def orient_radial_helper(ob, act, hit, normal):
+    """Align the circles of a radial helper to the surface normal at hit"""
+    vec = normal.normalized()
+    z = Vector((0, 0, 1))
+    angle = vec.angle(z)
+    axis = z.cross(vec)
+    if axis.length == 0.0:
+        #normal along z, any perpendicular axis does for flipping
+        axis = Vector((1, 0, 0))
+    mat = Matrix.Rotation(angle, 4, axis)
+    mat.translation = act.matrix_world.inverted() * hit
+    
+    ob.matrix_world = act.matrix_world * mat
+
+def setup_interactive_helpers(md, modes, points=False):
+    """Point the fracture modifier to the InteractiveHelpers group, with the point
+       sources the given mouse modes need"""
+    gr = bpy.data.groups.get("InteractiveHelpers", None)
+    if gr is None:
+        gr = bpy.data.groups.new("InteractiveHelpers")
+    md.extra_group = gr
+    md.refresh = False
+    if "Uniform" in modes and points:
+        md.point_source = md.point_source.union({'EXTRA_VERTS'})
+    elif "Uniform" in modes:
+        md.point_source = md.point_source.union({'EXTRA_PARTICLES'})
+        md.use_particle_birth_coordinates = True
+    if "Radial" in modes:
+        md.point_source = md.point_source.union({'EXTRA_VERTS'})
+    return gr
+
+def link_helper(context, gr, act, ob, mode):
+    """Turn a placed mouse helper into a fracture helper of act"""
+    #the n-th helper of act in this group, same for the same clicks on the same object
+    seed = helper_seed(context.scene, "{}_MouseHelper{}".format(act.name, len(gr.objects)))
+    if mode == "Uniform" and context.scene.helper_point_mode == "Points":
+        make_point_helper(ob, context.scene, context.scene.mouse_count, seed)
+    elif mode == "Uniform":
+        setup_particles(context.scene.mouse_count, ob, seed)
+    gr.objects.link(ob)
+    ob.matrix_basis = act.matrix_world.inverted() * ob.matrix_basis
+    ob.parent = act
+    #put last helpers on a higher layer, in this case layer 16.
+    ob.layers = [x == 15 for x in range(20)]
+    ob.hide = True
+
+def place_helpers(context, act, records, refresh=True):
+    """Create mouse fracture helpers for act without any interaction, records are
+       (world hit location, normal, size, mode) tuples with mode Uniform or Radial.
+       Helper shape, counts, rings and segments are taken from the scene settings.
+       All helpers are refractured at once, returns the created helpers"""
+    scene = context.scene
+    md = find_modifier(act, 'FRACTURE')
+    gr = setup_interactive_helpers(md, {r[3] for r in records}, scene.helper_point_mode == "Points")
+    helpers = []
+    
+    for location, normal, size, mode in records:
+        location = Vector(location)
+        if mode == "Radial":
+            ob = make_radial_helper(context, location, scene.mouse_segments, scene.mouse_rings)
+            orient_radial_helper(ob, act, location, Vector(normal))
+        else:
+            ob = make_uniform_helper(context, location, scene.mouse_object, scene.mouse_custom_object)
+            if ob is None:
+                continue
+        
+        ob.dimensions = (size, size, size)
+        ob.draw_type = 'WIRE'
+        link_helper(context, gr, act, ob, mode)
+        helpers.append(ob)
+    
+    for o in context.selected_objects:
+        o.select = False
+    act.select = True
+    scene.objects.active = act
+    if refresh and helpers:
+        bpy.ops.object.fracture_refresh(reset=False)
+    
+    return helpers
+
+def sample_unit_points(count, shape, seed=0):
+    """Cheap stand-in for a volume / random particle emitter, points in the box
+       [-1, 1], or inside the unit sphere for spherical helpers"""
+    rng = np.random.RandomState(seed)
+    if shape == "Sphere":
+        pts = np.empty((0, 3))
+        while len(pts) < count:
+            cand = rng.uniform(-1.0, 1.0, (count * 2, 3))
+            pts = np.vstack((pts, cand[(cand * cand).sum(axis=1) <= 1.0]))
+        return pts[:count]
+    return rng.uniform(-1.0, 1.0, (count, 3))
+
+def helper_preview_points(ob, unit):
+    """Fit unit points into the bounds of the helper, in world space"""
+    corners = np.array([co[:] for co in ob.bound_box])
+    lo = corners.min(axis=0)
+    hi = corners.max(axis=0)
+    local = (lo + hi) * 0.5 + unit * (hi - lo) * 0.5
+    #matrix_basis is up to date with the dimensions set while dragging, matrix_world not yet
+    mat = np.array(ob.matrix_basis)
+    return local.dot(mat[:3, :3].T) + mat[:3, 3]
+
+def draw_preview_points(op, context):
+    if op.preview is None:
+        return
+    
+    bgl.glEnable(bgl.GL_BLEND)
+    bgl.glPointSize(3.0)
+    bgl.glColor4f(1.0, 0.5, 0.0, 0.8)
+    bgl.glBegin(bgl.GL_POINTS)
+    for co in op.preview:
+        bgl.glVertex3f(co[0], co[1], co[2])
+    bgl.glEnd()
+    
+    #restore opengl defaults
+    bgl.glPointSize(1.0)
+    bgl.glDisable(bgl.GL_BLEND)
+    bgl.glColor4f(0.0, 0.0, 0.0, 1.0)
+
 def check_fm():
     if bpy.context.active_object is None:
         return False
@@ -253,7 +659,37 @@ class ViewOperatorFracture(bpy.types.Operator):
     md = None
     gr = None
     msg = "Press LMB over fractured object to create helper, drag mouse to change size, release LMB to confirm, RMB or Esc ends modal operator"
+    msg_deferred = "Press LMB over fractured object to create helper, drag mouse to change size, release LMB to confirm, Enter refreshes queued helpers, RMB or Esc ends modal operator"
     scale = Vector((1, 1, 1))
+    timer = None
+    pending = False
+    placed = 0.0
+    draw_handle = None
+    preview_unit = None
+    preview = None
+
+    def refresh(self, context):
+        #one refracture for all helpers placed since the last refresh
+        self.pending = False
+        context.scene.objects.active = self.act
+        if check_fm():
+            bpy.ops.object.fracture_refresh(reset=False)
+
+    def finish(self, context):
+        if self.timer is not None:
+            context.window_manager.event_timer_remove(self.timer)
+            self.timer = None
+        if self.draw_handle is not None:
+            bpy.types.SpaceView3D.draw_handler_remove(self.draw_handle, 'WINDOW')
+            self.draw_handle = None
+            self.preview = None
+            context.area.tag_redraw()
+        if self.pending:
+            self.refresh(context)
+        #picking trees and duplis arent needed anymore
+        bvh_cache.clear()
+        dupli_cache["frame"] = None
+        dupli_cache["items"].clear()
 
     def modal(self, context, event):
         #if event.type in {'MIDDLEMOUSE', 'WHEELUPMOUSE', 'WHEELDOWNMOUSE'}:
@@ -283,87 +719,57 @@ class ViewOperatorFracture(bpy.types.Operator):
                         #bpy.ops.object.editmode_toggle()
                         
                         #sphere wont work so try with concentric circles
-                        radius = 0.15
-                        bpy.ops.mesh.primitive_circle_add(radius=radius, \
-                                                              vertices=context.scene.mouse_segments, \
-                                                              location=hit)
-                        
-                        bpy.ops.object.editmode_toggle()
-             
-                        radius += 0.1
-                        for r in range(context.scene.mouse_rings):
-                            bpy.ops.mesh.primitive_circle_add(radius=radius, \
-                                                              vertices=context.scene.mouse_segments, \
-                                                              location=hit)
-                            ob = context.active_object
-                            ob.select = True
-                            radius += 0.1
-                        
-                        bpy.ops.object.editmode_toggle()
-                        
-                        z = Vector((0, 0, 1))
-                        ob = context.active_object
-                        angle = vec.angle(z)
-                        axis = z.cross(vec)
-                        mat = Matrix.Rotation(angle, 4, axis)
-                        mat.translation = self.act.matrix_world.inverted() * hit
-                        
-                        ob.matrix_world = self.act.matrix_world * mat
+                        ob = make_radial_helper(context, hit, context.scene.mouse_segments, context.scene.mouse_rings)
+                        orient_radial_helper(ob, self.act, hit, vec)
                                                      
                     else:
-                        if context.scene.mouse_object == "Cube":
-                            bpy.ops.mesh.primitive_cube_add(radius = 0.05, location=hit)
-                        elif context.scene.mouse_object == "Sphere":
-                            bpy.ops.mesh.primitive_uv_sphere_add(size = 0.05, location=hit)
-                        else:
-                            if context.scene.mouse_custom_object == "":
-                                self.report({'WARNING'}, "Need to pick a custom object, please retry")
-                                return {'CANCELLED'}
-                                
-                            ob = bpy.data.objects[context.scene.mouse_custom_object]
-                            if ob != None:
-                                context.scene.objects.active = ob
-                                self.act.select = False
-                                ob.select = True
-                                bpy.ops.object.duplicate()
-                                nob = context.active_object
-                                nob.location = hit
-                            else:
-                                self.report({'WARNING'}, "Need to pick a custom object, please retry")
-                                return {'CANCELLED'}
+                        ob = make_uniform_helper(context, hit, context.scene.mouse_object, context.scene.mouse_custom_object)
+                        if ob is None:
+                            self.report({'WARNING'}, "Need to pick a custom object, please retry")
+                            self.finish(context)
+                            return {'CANCELLED'}
                     self.scaling = True
                     self.hit2d = event.mouse_region_x, event.mouse_region_y
+                    if context.scene.mouse_mode == "Uniform" and context.scene.mouse_preview:
+                        #fixed samples per helper, so the preview only scales while dragging
+                        self.preview_unit = sample_unit_points(context.scene.mouse_count, context.scene.mouse_object, 
+                                                               context.scene.fracture_seed)
                     context.active_object.draw_type = 'WIRE'
             elif event.value == 'RELEASE':
                    
                     self.hit2d = None
+                    self.preview_unit = None
+                    self.preview = None
+                    context.area.tag_redraw()
                     #print(self.act, context.active_object)
                     if not self.scaling:
                         self.report({'WARNING'}, "Ambigous target object, please retry")
                         context.scene.mouse_status = "Start mouse based fracture"
                         context.area.header_text_set()
+                        self.finish(context)
                         return {'CANCELLED'}
 
                     self.scaling = False
                     if self.act != context.active_object and self.act is not None \
                     and context.active_object is not None:
-                        if context.scene.mouse_mode == "Uniform":
-                            setup_particles(context.scene.mouse_count)
-                        self.gr.objects.link(context.active_object)
-                        context.active_object.parent = self.act
-                        context.active_object.location -= self.act.location
-                        #put last helpers on a higher layer, in this case layer 16.
-                        for x in range(0, 19):
-                            if x == 15:
-                                context.active_object.layers[x] = True
-                            else:
-                                context.active_object.layers[x] = False
-                        
-                        context.active_object.hide = True
+                        link_helper(context, self.gr, self.act, context.active_object, context.scene.mouse_mode)
                         context.scene.objects.active = self.act
-                        if check_fm(): #active object changes here, so check again
+                        if context.scene.mouse_defer_refresh:
+                            #queue it, the timer fires one refresh once placing is idle
+                            self.pending = True
+                            self.placed = time.time()
+                        elif check_fm(): #active object changes here, so check again
                             bpy.ops.object.fracture_refresh(reset=False)
             return {'RUNNING_MODAL'}
+        elif event.type == 'TIMER':
+            if self.pending and not self.scaling and \
+            time.time() - self.placed >= context.scene.mouse_refresh_delay:
+                self.refresh(context)
+            return {'PASS_THROUGH'}
+        elif event.type in {'RET', 'NUMPAD_ENTER'}:
+            if event.value == 'PRESS' and self.pending and not self.scaling:
+                self.refresh(context)
+            return {'RUNNING_MODAL'}
         elif event.type == 'MOUSEMOVE':
             if not self.scaling:
                 #main(context, event)
@@ -374,6 +780,9 @@ class ViewOperatorFracture(bpy.types.Operator):
                 size *= 0.25
                 if context.scene.mouse_mode == "Uniform":
                     context.active_object.dimensions = (size, size, size)
+                    if self.preview_unit is not None:
+                        self.preview = helper_preview_points(context.active_object, self.preview_unit)
+                        context.area.tag_redraw()
                 else:
                     context.active_object.dimensions = (size * self.scale[0], 
                                                         size * self.scale[1],
@@ -385,13 +794,15 @@ class ViewOperatorFracture(bpy.types.Operator):
             context.scene.mouse_status = "Start mouse based fracture"
             #delete group and group objects if desired
             if context.scene.delete_helpers:
+                self.pending = False
                 for o in self.gr.objects:
                     self.gr.objects.unlink(o)
                     context.scene.objects.unlink(o)
                     o.user_clear()
                     bpy.data.objects.remove(o)
                 bpy.data.groups.remove(self.gr, do_unlink=True)
-                
+            
+            self.finish(context)
             return {'CANCELLED'}
 
         return {'PASS_THROUGH'}
@@ -409,20 +820,20 @@ class ViewOperatorFracture(bpy.types.Operator):
                     self.md = md
                     break
             if self.md is not None:
-                if bpy.data.groups.get("InteractiveHelpers", None) is None:
-                    self.gr = bpy.data.groups.new("InteractiveHelpers")
-                else:
-                    self.gr = bpy.data.groups["InteractiveHelpers"]
+                #start each session with fresh instances, the cache is kept across clicks
+                dupli_cache["frame"] = None
+                self.gr = setup_interactive_helpers(self.md, {context.scene.mouse_mode}, 
+                                                   context.scene.helper_point_mode == "Points")
                 self.act = context.active_object
-                self.md.extra_group = self.gr
-                self.md.refresh = False
-                if context.scene.mouse_mode == "Uniform":
-                    self.md.point_source = md.point_source.union({'EXTRA_PARTICLES'})
-                    self.md.use_particle_birth_coordinates = True
-                else:
-                    self.md.point_source = md.point_source.union({'EXTRA_VERTS'})
                 
-                context.area.header_text_set(text=self.msg)
+                if context.scene.mouse_defer_refresh:
+                    context.area.header_text_set(text=self.msg_deferred)
+                else:
+                    context.area.header_text_set(text=self.msg)
+                self.pending = False
+                self.timer = context.window_manager.event_timer_add(0.1, context.window)
+                self.preview = None
+                self.draw_handle = bpy.types.SpaceView3D.draw_handler_add(draw_preview_points, (self, context), 'WINDOW', 'POST_VIEW')
                 context.scene.mouse_status = "Mouse based fracture running"
                 context.object.show_wire = True
                 context.scene.layers[15] = True
@@ -436,17 +847,89 @@ class ViewOperatorFracture(bpy.types.Operator):
             self.report({'WARNING'}, "Active space must be a View3d")
             return {'CANCELLED'}
 
+def helper_from_object(context, src, median=True):
+    """Bake the evaluated mesh of src (modifiers and FM applied, curves converted)
+       into a new helper object, without any operators. Its origin is put to the
+       vertex median or to the center of the bounds"""
+    me = src.to_mesh(context.scene, True, 'PREVIEW')
+    
+    mat = src.matrix_world.copy()
+    if find_modifier(src, 'FRACTURE') is None and src.rigid_body is not None:
+        #take over the simulated rigidbody transformation
+        scale = src.matrix_world.to_scale()
+        mat = Matrix.Translation(src.rigid_body.location) * \
+              src.rigid_body.rotation.to_matrix().to_4x4() * \
+              Matrix(((scale[0], 0, 0, 0), (0, scale[1], 0, 0), (0, 0, scale[2], 0), (0, 0, 0, 1)))
+    
+    count = len(me.vertices)
+    center = Vector((0.0, 0.0, 0.0))
+    if count > 0:
+        co = np.empty(count * 3, dtype=np.float32)
+        me.vertices.foreach_get("co", co)
+        co = co.reshape(count, 3)
+        if median:
+            center = Vector(co.mean(axis=0))
+        else:
+            center = Vector((co.min(axis=0) + co.max(axis=0)) * 0.5)
+        co -= np.array(center, dtype=np.float32)
+        me.vertices.foreach_set("co", co.ravel())
+        me.update()
+    
+    ob = bpy.data.objects.new(src.name.split(".")[0] + "_helper", me)
+    ob.matrix_world = mat * Matrix.Translation(center)
+    context.scene.objects.link(ob)
+    
+    ob.draw_type = 'BOUNDS'
+    ob.hide_render = True
+    ob.show_name = True
+    ob.show_x_ray = True
+    ob.show_wire = False
+    ob.layers = [x == 19 for x in range(20)]
+    
+    return ob
+
+class HelperRecord(bpy.types.PropertyGroup):
+    location = bpy.props.FloatVectorProperty(name="location", description="World space hit location", subtype='XYZ')
+    normal = bpy.props.FloatVectorProperty(name="normal", description="World space surface normal", default=(0.0, 0.0, 1.0), subtype='XYZ')
+    size = bpy.props.FloatProperty(name="size", description="Helper size", default=0.1, min=0.0)
+    mode = bpy.props.EnumProperty(name="mode", items=[("Uniform", "Uniform", "Uniform", 'MESH_CUBE', 0), \
+                                                      ("Radial", "Radial", "Radial", 'MESH_UVSPHERE', 1)])
+
+class BatchHelperOperator(bpy.types.Operator):
+    """Create mouse fracture helpers from a list of hit records and refracture once (scriptable)"""
+    bl_idname = "fracture.batch_helpers"
+    bl_label = "Batch helpers"
+    
+    records = bpy.props.CollectionProperty(name="records", type=HelperRecord)
+    refresh = bpy.props.BoolProperty(name="refresh", default=True)
+    
+    def execute(self, context):
+        act = context.active_object
+        if act is None or find_modifier(act, 'FRACTURE') is None:
+            self.report({'WARNING'}, "Need an active object with fracture modifier")
+            return {'CANCELLED'}
+        
+        records = [(r.location[:], r.normal[:], r.size, r.mode) for r in self.records]
+        if len(records) == 0:
+            self.report({'WARNING'}, "No helper records given")
+            return {'CANCELLED'}
+        
+        if context.scene.mouse_object == "Custom" and any(r[3] == "Uniform" for r in records) and \
+        bpy.data.objects.get(context.scene.mouse_custom_object) is None:
+            self.report({'WARNING'}, "Need to pick a custom object, please retry")
+            return {'CANCELLED'}
+        
+        place_helpers(context, act, records, self.refresh)
+        return {'FINISHED'}
+
 def main(context, start=1, random=0.0, snap=True):
    context.scene.layers[19] = True
    act = context.active_object
    act.select = False
    gr = None
-   
-   for ob in bpy.data.objects:
-       try:
-           ob["isCurve"] = 0
-       except KeyError:
-           pass
+   #selected curves, only these can become the animation path
+   curves = set()
+   points = context.scene.helper_point_mode == "Points"
 
    for md in act.modifiers:
        if md.type == 'FRACTURE':
@@ -455,50 +938,18 @@ def main(context, start=1, random=0.0, snap=True):
           break
    for ob in context.selected_objects:
        if ob != act:
-            ob["isCurve"] = (ob.type == 'CURVE')
+            if ob.type == 'CURVE':
+                curves.add(ob)
             if (gr is not None) and ob.name in gr.objects:
                 #already in existing group, skip  
                 ob.select = False
 
-   if (snap == True):            
-       bpy.ops.view3d.snap_cursor_to_selected()
-   else:
-       bpy.ops.view3d.snap_cursor_to_active()
-              
-   bpy.ops.object.duplicate()
-   #apply rigidbody rotation for all selected objs
-   
-   for ob in context.selected_objects:
-       if ob != act: 
-           #if we have an FM, apply it
-           md = find_modifier(ob, 'FRACTURE')
-           if md is not None:
-               context.scene.objects.active = ob
-               bpy.ops.object.modifier_apply(apply_as='DATA', modifier=md.name)
-               context.scene.objects.active = act
-           elif ob.rigid_body is not None:
-               mat = Matrix.Translation(ob.rigid_body.location).to_3x3()
-               mat.rotate(ob.rigid_body.rotation)
-               ob.matrix_world = mat.to_4x4()
-               
-   bpy.ops.anim.keyframe_clear_v3d()   
-   bpy.ops.rigidbody.objects_remove()
-   
-   for ob in context.selected_objects:
-       if ob != act:
-            context.scene.objects.active = ob
-            bpy.ops.object.origin_set(type='ORIGIN_GEOMETRY', center='BOUNDS')
-            ob.draw_type = 'BOUNDS'
-            ob.hide_render = True
-            ob.show_name = True
-            ob.show_x_ray = True
-            ob.show_wire = False
-            ob.name = ob.name.split(".")[0] + "_helper"
-            ob.layers[19] = True
-            for x in range(0, 19):
-                ob.layers[x] = False
-
-   bpy.ops.object.convert(target='MESH', keep_original=False)
+   #convert all selected objects to helpers on data level, originals stay untouched
+   sources = [ob for ob in context.selected_objects if ob != act]
+   helpers = []
+   for ob in sources:
+       helpers.append(helper_from_object(context, ob, median=(snap == True and ob.type != 'CURVE')))
+       ob.select = False
    
    if gr is None:
        gr = bpy.data.groups.new("Helper")
@@ -508,20 +959,14 @@ def main(context, start=1, random=0.0, snap=True):
    else:
         context.scene.frame_set(1.0)
           
-   for ob in context.selected_objects:
-       if ob != act:
+   for ob, src in zip(helpers, sources):
             print(ob, act)
-            context.scene.objects.active = ob
             gr.objects.link(ob)
             
             ob.matrix_world = act.matrix_world.inverted() * ob.matrix_world
             ob.parent = act
             
-            if (snap == True and not ob["isCurve"]):
-                bpy.ops.object.origin_set(type='ORIGIN_GEOMETRY')
-                bpy.ops.view3d.snap_selected_to_cursor(use_offset=True)
-            
-            if (ob["isCurve"]):
+            if (src.type == 'CURVE'):
                 #psys.emit_from = 'VERT'
                 ob.modifiers.new(type='SKIN', name='SkinHelper')
             
@@ -530,8 +975,15 @@ def main(context, start=1, random=0.0, snap=True):
                 #add solidify on inner face helper
                 mod = ob.modifiers.new(type='SOLIDIFY', name='SolidifyHelper')
                 mod.thickness = 0.25
+            
+            #from the source object, the helper name depends on whats in the file
+            seed = helper_seed(context.scene, act.name + "_" + src.name)
+            if points:
+                make_point_helper(ob, context.scene, context.scene.helper_point_count, seed)
+                continue
 
             ob.modifiers.new(type='PARTICLE_SYSTEM', name='ParticleHelper')
+            ob.particle_systems[0].seed = seed
             #make particle system settings here....
             psys = ob.particle_systems[0].settings
             psys.count = 500
@@ -552,16 +1004,17 @@ def main(context, start=1, random=0.0, snap=True):
             #else:
             psys.emit_from = 'VOLUME'
             psys.distribution = 'RAND'
-                
-            ob.select = False
             
    context.scene.objects.active = act
    for md in act.modifiers:
        if md.type == 'FRACTURE':
            md.extra_group = gr
            md.refresh = False
-           md.point_source = md.point_source.union({'EXTRA_PARTICLES'})
-           md.use_particle_birth_coordinates = False
+           if points:
+               md.point_source = md.point_source.union({'EXTRA_VERTS'})
+           else:
+               md.point_source = md.point_source.union({'EXTRA_PARTICLES'})
+               md.use_particle_birth_coordinates = False
            break
 
    act.select = True
@@ -575,19 +1028,13 @@ def main(context, start=1, random=0.0, snap=True):
    anim_ob = context.scene.animation_obj
    if (use_curve == True and anim_ob != ""):
        anim_ob = bpy.data.objects[anim_ob] 
-       for ob in bpy.data.objects:
-            try:
-                if ((ob["isCurve"] == 1) and (ob.type == 'CURVE')):
-                    print("FOUND CURVE", ob)
-                    ob.select = True
-                    context.scene.objects.active = ob
-                    bpy.ops.object.transform_apply(location=False, rotation=True, scale=False)
-                    ob["isCurve"] = 0
-                else:
-                    ob.select = False
-                    ob["isCurve"] = 0
-            except KeyError:
-                ob.select = False
+       for ob in context.selected_objects:
+            ob.select = False
+       for ob in curves:
+            print("FOUND CURVE", ob)
+            ob.select = True
+            context.scene.objects.active = ob
+            bpy.ops.object.transform_apply(location=False, rotation=True, scale=False)
                 
        anim_ob.select = True
        bpy.ops.object.parent_set(type='PATH_CONST')
@@ -688,6 +1135,9 @@ class FracturePathPanel(bpy.types.Panel):
         col.label("Combination:", icon='PINNED')
         col.operator("fracture.combine_subobjects",text="Combine",icon='GROUP').constraints_only=False
         col.operator("fracture.combine_subobjects",text="Connect",icon='EMPTY_DATA').constraints_only=True
+        row = col.row(align=True)
+        row.operator("fracture.connector_members",text="Add",icon='ZOOMIN').remove=False
+        row.operator("fracture.connector_members",text="Remove",icon='ZOOMOUT').remove=True
 
 
 ### from now much stuff is put into a common panel,  its better than having separate panels for everything
@@ -712,6 +1162,11 @@ class FractureHelperPanel(bpy.types.Panel):
         #col.prop(context.object, "particle_random", text="Particle random")
         if context.object:
             systems = len(context.object.particle_systems)
+        row = col.row(align=True)
+        row.prop(context.scene, "helper_point_mode", text="Helper Points", expand=True)
+        col.prop(context.scene, "fracture_seed", text="Seed")
+        if context.scene.helper_point_mode == "Points":
+            col.prop(context.scene, "helper_point_count", text="Point amount")
         col.operator("fracture.create_helper", icon='MOD_PARTICLES')
         if systems > 0:
             if systems > 1:
@@ -736,13 +1191,20 @@ class FractureHelperPanel(bpy.types.Panel):
             row.prop(context.scene, "mouse_object", text="Helper Object", expand=True)
             if (context.scene.mouse_object == "Custom"):
                 col.prop_search(context.scene, "mouse_custom_object", bpy.data, "objects", text="")
-            col.prop(context.scene, "mouse_count", text="Shard count")
+            row = col.row(align=True)
+            row.prop(context.scene, "mouse_count", text="Shard count")
+            row.prop(context.scene, "mouse_preview", text="", icon='PARTICLE_POINT')
         else:
             row = col.row(align=True)
             row.prop(context.scene, "mouse_segments", text="Segments")
             row.prop(context.scene, "mouse_rings", text="Rings")
             
         col.prop(context.scene, "delete_helpers", text="Delete helpers afterwards", icon='X')
+        row = col.row(align=True)
+        row.prop(context.scene, "mouse_defer_refresh", text="Deferred refresh", icon='TIME')
+        sub = row.row(align=True)
+        sub.active = context.scene.mouse_defer_refresh
+        sub.prop(context.scene, "mouse_refresh_delay", text="Idle")
         col.operator("fracture.mouse_based_fracture", text=context.scene.mouse_status, icon='RESTRICT_SELECT_OFF')
         col.separator()
         col.separator()
@@ -752,6 +1214,12 @@ class FractureHelperPanel(bpy.types.Panel):
         col.label(text="Rough edges:", icon='PINNED')
         col.operator("fracture.create_cluster_helpers", icon='FCURVE')
         col.operator("fracture.create_displaced_edges", icon='FCURVE')
+        col.operator("fracture.merge_textures", icon='TEXTURE')
+        row = col.row(align=True)
+        row.prop(context.scene, "use_background_fracture", text="Background", icon='FORCE_TURBULENCE')
+        sub = row.row(align=True)
+        sub.active = context.scene.use_background_fracture
+        sub.prop(context.scene, "fracture_workers", text="Workers")
             
             
             
@@ -770,6 +1238,8 @@ class TimingPanel(bpy.types.Panel):
         #Time control:
         col.label(text="Delayed fracture:", icon='PINNED')
         col.prop(context.scene, "is_dynamic", text="Object moves", icon='FORCE_HARMONIC')
+        if context.scene.is_dynamic:
+            col.prop(context.scene, "use_bulk_keys", text="Bulk key insert", icon='REC')
         col.prop(context.scene, "fracture_frame", text="Start fracture from frame")
         col.operator("fracture.frame_set", icon='PREVIEW_RANGE')
         
@@ -782,6 +1252,11 @@ class TimingPanel(bpy.types.Panel):
         row = col.row(align=True)
         row.operator("fracture.clear_all_timescale")
         row.operator("fracture.apply_timescale")
+        
+        col = layout.column(align=True)
+        col.prop(context.scene, "show_timescale_preview", text="Time remap preview", icon='IPO')
+        if context.scene.show_timescale_preview:
+            draw_timescale_preview(col, context.scene)
 
 #def update_wire(self, context):
 #    context.object.show_wire = context.object.use_wire
@@ -812,19 +1287,105 @@ class TimingPanel(bpy.types.Panel):
 #    if len(context.object.particle_systems) > 0:
 #       context.object.particle_systems[0].settings.factor_random = context.object.particle_random
 
-def store_rb_to_dict(ob):
+# (name, is_array) of the writable properties per RNA type, see rna_schema()
+rna_schema_cache = {}
+
+def is_id_type(struct):
+    while struct is not None:
+        if struct.identifier == "ID":
+            return True
+        struct = struct.base
+    return False
+
+def rna_schema(data):
+    """Writable properties of the RNA type of data, computed once per type. Only
+       scalar, vector, enum and string values and ID pointers, so a snapshot
+       doesnt refer to the struct itself and can outlive it"""
+    key = data.bl_rna.identifier
+    schema = rna_schema_cache.get(key)
+    if schema is None:
+        schema = []
+        for p in data.bl_rna.properties:
+            if p.identifier in {"rna_type", "name"} or p.is_readonly or p.type == 'COLLECTION':
+                continue
+            if p.type == 'POINTER' and not is_id_type(p.fixed_type):
+                continue
+            schema.append((p.identifier, getattr(p, "array_length", 0) > 0))
+        rna_schema_cache[key] = schema
+    return schema
+
+def store_props_to_dict(data):
     d = {}
-    for k in ob.rigid_body.bl_rna.properties.keys():
-        if k != "rna_type":
-          d[k] = getattr(ob.rigid_body, k)
-          
+    for k, is_array in rna_schema(data):
+        v = getattr(data, k)
+        d[k] = v[:] if is_array else v
+    
     return d
+
+def load_props_from_dict(data, d):
+    #only what the target has, so snapshots can go to a different struct too
+    for k, is_array in rna_schema(data):
+        if k in d:
+            try:
+                setattr(data, k, d[k])
+            except (AttributeError, TypeError, ValueError):
+                #not valid here, keep the current value
+                pass
+
+def store_rb_to_dict(ob):
+    return store_props_to_dict(ob.rigid_body)
           
 def load_rb_from_dict(ob, d):
-    for k in ob.rigid_body.bl_rna.properties.keys():
-        if k != "rna_type":
-          setattr(ob.rigid_body, k, d[k])      
+    load_props_from_dict(ob.rigid_body, d)
 
+def store_rb_snapshot(obs):
+    """Rigid body settings of many objects at once, keyed by object name"""
+    return {ob.name: store_props_to_dict(ob.rigid_body) for ob in obs if ob.rigid_body is not None}
+
+def load_rb_snapshot(obs, snapshot):
+    for ob in obs:
+        d = snapshot.get(ob.name)
+        if d is not None and ob.rigid_body is not None:
+            load_props_from_dict(ob.rigid_body, d)
+
+
+def can_bulk_bake(ob):
+    #parented objects and quaternion / axis angle rotation need the full bake
+    return ob.parent is None and ob.rotation_mode in {'XYZ', 'XZY', 'YXZ', 'YZX', 'ZXY', 'ZYX'}
+
+def bulk_bake_to_keyframes(context, ob, frame_start, frame_end):
+    """Like rigidbody.bake_to_keyframes for a single object, but only reads its
+       simulated matrix per frame and writes all location / rotation keys in one go.
+       Stepping the simulation costs the same as with the operator"""
+    scene = context.scene
+    frames = np.arange(frame_start, frame_end + 1, dtype=np.float32)
+    loc = np.empty((len(frames), 3), dtype=np.float32)
+    rot = np.empty((len(frames), 3), dtype=np.float32)
+    prev = None
+    
+    #the point cache isnt accessible from python, so step the (cached) simulation
+    for i in range(len(frames)):
+        scene.frame_set(frame_start + i)
+        mat = ob.matrix_world
+        loc[i] = mat.to_translation()
+        rot3 = mat.to_3x3().normalized()
+        eul = rot3.to_euler(ob.rotation_mode) if prev is None else rot3.to_euler(ob.rotation_mode, prev)
+        rot[i] = eul
+        prev = eul
+    
+    if ob.animation_data is None:
+        ob.animation_data_create()
+    if ob.animation_data.action is None:
+        ob.animation_data.action = bpy.data.actions.new(ob.name + "Action")
+    
+    action = ob.animation_data.action
+    for i in range(3):
+        write_fcurve(action, "location", i, frames, loc[:, i], "Object Transforms", clean=True)
+        write_fcurve(action, "rotation_euler", i, frames, rot[:, i], "Object Transforms", clean=True)
+    
+    #baked objects dont simulate anymore, same as with the operator
+    scene.frame_set(frame_start)
+    bpy.ops.rigidbody.object_remove()
 
 class FractureFrameOperator(bpy.types.Operator):
     """Tooltip"""
@@ -844,11 +1405,9 @@ class FractureFrameOperator(bpy.types.Operator):
                 self.report({'WARNING'}, "Need an active object with fracture modifier!") 
                 return {'CANCELLED'}
                 
-            #if FractureMod, then save preset (FrameHelperPreset) and remove mod
+            #if FractureMod, then keep its settings in memory and remove mod
             bpy.ops.object.fracture_refresh(reset=True)
-            ctx = context.copy()
-            ctx["fracture"] = md
-            bpy.ops.fracture.preset_add(ctx, name="helperpreset")
+            settings = store_props_to_dict(md)
             
             #determine old stack position (for re-insert there)
             pos = 0
@@ -879,7 +1438,10 @@ class FractureFrameOperator(bpy.types.Operator):
             
             d = store_rb_to_dict(context.object)
             if (context.scene.is_dynamic):
-                bpy.ops.rigidbody.bake_to_keyframes('EXEC_DEFAULT', frame_start=1, frame_end=frame_end, step=1)
+                if context.scene.use_bulk_keys and can_bulk_bake(context.object):
+                    bulk_bake_to_keyframes(context, context.object, 1, frame_end)
+                else:
+                    bpy.ops.rigidbody.bake_to_keyframes('EXEC_DEFAULT', frame_start=1, frame_end=frame_end, step=1)
                           
             context.scene.frame_set(1)
            
@@ -898,16 +1460,9 @@ class FractureFrameOperator(bpy.types.Operator):
             context.scene.frame_set(1)
             
             #re-add fracture modifier
-            bpy.ops.object.modifier_add(type='FRACTURE')
-            #paths = bpy.utils.preset_paths("fracture")
-            filepath = bpy.utils.preset_find("helperpreset", "fracture")
-            for md in context.object.modifiers:
-                if md.type == 'FRACTURE':
-                    break
-            ctx = context.copy()
-            ctx["fracture"] = md
-            bpy.ops.script.execute_preset(ctx, filepath=filepath, menu_idname="FRACTURE_MT_presets")
-            bpy.context.object.modifiers["Fracture"].uv_layer = "InnerUV"
+            md = context.object.modifiers.new(type='FRACTURE', name="Fracture")
+            load_props_from_dict(md, settings)
+            md.uv_layer = ensure_uv(context.object, "InnerUV").name
             #bpy.ops.object.fracture_refresh()
             
             #Move FM to position in modifier stack
@@ -919,51 +1474,49 @@ class FractureFrameOperator(bpy.types.Operator):
             self.report({'WARNING'}, "Need an active object with fracture modifier!") 
             return {'CANCELLED'}
             
+def island_centroids(md):
+    """Vertex centers of the FM mesh islands (shards), in object space"""
+    centroids = []
+    for mi in md.mesh_islands:
+        n = len(mi.vertices)
+        if n == 0:
+            continue
+        co = np.empty(n * 3, dtype=np.float32)
+        mi.vertices.foreach_get("co", co)
+        centroids.append(co.reshape(n, 3).mean(axis=0))
+    
+    return np.array(centroids, dtype=np.float32).reshape(-1, 3)
+
 class ClusterHelperOperator(bpy.types.Operator):
     """Extracts the inner faces and uses this new mesh to generate smaller shards. These will be glued used clustergroups"""
     bl_idname = "fracture.create_cluster_helpers"
     bl_label = "Physical rough edges"
 
-    def make_cluster_cores(self, context, oldact, lastact):
-        # now convert to objects and create empties at the locs
+    def make_cluster_cores(self, context, md, oldact, lastact):
+        # create empties at the shard centroids, without converting the shards to objects
         tempOb = lastact #context.active_object
         print(tempOb)
         context.scene.objects.active = oldact
         for o in bpy.data.objects:
             o.select = False
 
-        oldact.select = True
-        bpy.ops.object.rigidbody_convert_to_objects()
-
-        gr = bpy.data.groups["OB"+oldact.name+"_conv"]
         gh = bpy.data.groups.new("ClusterHelpers")
         context.scene.layers[18] = True
+        layers = [i == 18 for i in range(20)]
+        
+        #parent Clusterparent to baseobject
         par = bpy.data.objects.new("ClusterHelperParent", None)
-        par.matrix_world = oldact.matrix_world.copy()
+        par.parent = oldact
         context.scene.objects.link(par)
-        par.layers[18] = True
-        par.layers[0] = False
-        for go in gr.objects:
-            if go == tempOb:
-                continue
+        par.layers = layers
+        
+        for co in island_centroids(md):
             ob = bpy.data.objects.new("ClusterHelper", None)
-            #ob.location = go.location.copy() - par.location
-            ob.matrix_world = par.matrix_world.inverted() * go.matrix_world.copy()
+            ob.location = co
             ob.parent = par
             context.scene.objects.link(ob)
-            ob.layers[18] = True
-            ob.layers[0] = False
-            
+            ob.layers = layers
             gh.objects.link(ob)
-            gr.objects.unlink(go)
-            context.scene.objects.unlink(go)
-            bpy.data.objects.remove(go) 
-
-        bpy.data.groups.remove(gr, do_unlink=True)
-        
-        #parent Clusterparent to baseobject
-        par.matrix_world = oldact.matrix_world.inverted() * par.matrix_world.copy()
-        par.parent = oldact
         
         #parent innerfaces to baseobject (doesnt work here for some reason, so do it later)
         #tempOb.matrix_world = oldact.matrix_world.inverted() * tempOb.matrix_world.copy()
@@ -985,52 +1538,39 @@ class ClusterHelperOperator(bpy.types.Operator):
         for o in bpy.data.objects:
             o.select = False
             
-        active = context.active_object
-        active.select = True
-        oldact = active
-        
-        #need to dupe object for applying it
-        bpy.ops.object.duplicate()
-    
-        #context.active_object.select = True
-        #bpy.ops.object.transform_apply(location=False, rotation=False, scale=True)
-        # execute fracture again to be sure we have shards
-        bpy.ops.object.fracture_refresh(reset=True)
-        
-        # apply to get real mesh and edit it
-        bpy.ops.object.modifier_apply(apply_as='DATA', modifier=md.name)
-        context.active_object.data.update(True, True)
-        
-        #remove all other modifiers except FM
-        for mod in context.active_object.modifiers:
-            bpy.ops.object.modifier_remove(modifier=mod.name)
-        
-        bpy.ops.object.mode_set(mode='EDIT')
-        bpy.ops.mesh.select_all(action='DESELECT')
-        bpy.ops.object.mode_set(mode='OBJECT')
-        
-        context.tool_settings.mesh_select_mode = (False, False, True)
-        #i = 0
-        for p in context.active_object.data.polygons:
-            if p.material_index == 0:
-               #print(i, p.material_index, "SELECTED")
-               p.select = True
-            else:
-               #print(i, p.material_index, "DESELECTED")
-               p.select = False
-            #i += 1
-
-        bpy.ops.object.mode_set(mode='EDIT')
-        # delete all with outer material
-        bpy.ops.mesh.delete(type='FACE')
-        bpy.ops.object.mode_set(mode='OBJECT')
-
-        context.active_object.name = context.active_object.name[:-4] + "_Inner"
-        bpy.ops.rigidbody.objects_remove()
-
-        lastact = context.active_object
-        context.active_object.layers[18] = True
-        context.active_object.layers[0] = False
+        oldact = context.active_object
+        oldact.select = True
+        scene = context.scene
+        
+        #evaluate up to FM only, instead of duplicating and applying
+        after = []
+        found = False
+        for mod in oldact.modifiers:
+            if found and mod.show_viewport:
+                after.append(mod)
+                mod.show_viewport = False
+            found = found or mod == md
+        
+        me = oldact.to_mesh(scene, True, 'PREVIEW')
+        for mod in after:
+            mod.show_viewport = True
+        
+        #delete all with outer material
+        mat = np.empty(len(me.polygons), dtype=np.int32)
+        me.polygons.foreach_get("material_index", mat)
+        bm = bmesh.new()
+        bm.from_mesh(me)
+        bm.faces.ensure_lookup_table()
+        faces = bm.faces
+        bmesh.ops.delete(bm, geom=[faces[i] for i in np.flatnonzero(mat == 0).tolist()], context=5)
+        bm.to_mesh(me)
+        bm.free()
+        me.name = oldact.name + "_Inner"
+        
+        lastact = bpy.data.objects.new(oldact.name + "_Inner", me)
+        lastact.matrix_world = oldact.matrix_world.copy()
+        scene.objects.link(lastact)
+        lastact.layers = [i == 18 for i in range(20)]
         
         print("LAST:", lastact)
         
@@ -1057,7 +1597,7 @@ class ClusterHelperOperator(bpy.types.Operator):
             return {'CANCELLED'}
         
         oldact, lastact = self.extract_inner_faces(context, md)
-        gh = self.make_cluster_cores(context, oldact, lastact)
+        gh = self.make_cluster_cores(context, md, oldact, lastact)
         
         # FM: ClusterGroup: insert ClusterHelpers
         md.cluster_group = gh
@@ -1081,76 +1621,457 @@ def ensure_modifier(ob, type, name):
         md = ob.modifiers.new(type=type, name=name)
     return md
 
-def ensure_uv(context, ob, name):
-    
-    #doesnt work, sadly...
-    #uv = ob.data.uv_layers.new(name="InnerUV")
-    uv = None
-    context.scene.objects.active = ob
-    #InnerUV should be the 2nd one, 
+def ensure_uv(ob, name):
+    #uv_layers.new doesnt exist, but uv_textures.new adds the layer too and
+    #needs no active object, so it works from background scripts as well
     # maybe we want to have an outer UV too, so add anyway
-    
-    for u in ob.data.uv_layers:
-        if u.name == name:
-            uv = u
-            break
-        
+    me = ob.data
+    uv = me.uv_layers.get(name)
     if uv is None:
-        bpy.ops.mesh.uv_texture_add()
-        uv = ob.data.uv_layers.active
-        uv.name = name
+        me.uv_textures.new(name=name)
+        uv = me.uv_layers[name]
     
     return uv
 
-def ensure_texture(ob):
-    name = ob.name +  "_Displacement" 
-    try:
-        tex = bpy.data.textures[name]
-    except KeyError:
-        tex = bpy.data.textures.new(type='CLOUDS', name=name)
+def ensure_uvs(obs, name):
+    """Like ensure_uv, for many objects, each mesh only once"""
+    meshes = {ob.data for ob in obs if ob.type == 'MESH'}
+    for me in meshes:
+        if me.uv_layers.get(name) is None:
+            me.uv_textures.new(name=name)
+
+#pooled displacement texture names by requested settings, see ensure_texture()
+texture_pool = {}
+
+def texture_signature(tex):
+    """Checksum over the texture settings (not the ID ones like name or users)"""
+    id_props = bpy.types.ID.bl_rna.properties.keys()
+    items = []
+    for k, v in sorted(store_props_to_dict(tex).items()):
+        if k in id_props:
+            continue
+        if isinstance(v, bpy.types.ID):
+            v = v.name
+        items.append((k, v))
+    
+    return str(zlib.crc32(repr(items).encode()))
+
+def find_pooled_texture(sig, skip=None):
+    for tex in bpy.data.textures:
+        if tex != skip and tex.get("fracture_signature") == sig and texture_signature(tex) == sig:
+            return tex
+    return None
+
+def ensure_texture(type='CLOUDS', **params):
+    """Displacement texture with the given settings, shared by all objects which
+       ask for the same ones"""
+    key = (type, tuple(sorted(params.items())))
+    tex = bpy.data.textures.get(texture_pool.get(key, ""))
+    if tex is not None and tex.get("fracture_signature") == texture_signature(tex):
+        return tex
+    
+    tex = bpy.data.textures.new(type=type, name="Displacement")
+    for k, v in params.items():
+        setattr(tex, k, v)
+    sig = texture_signature(tex)
+    
+    #maybe its in the file already, but not in the pool (after load or edits)
+    pooled = find_pooled_texture(sig, tex)
+    if pooled is not None:
+        bpy.data.textures.remove(tex)
+        tex = pooled
+    else:
+        tex["fracture_signature"] = sig
     
+    texture_pool[key] = tex.name
     return tex
 
+def shade_smooth(me):
+    me.polygons.foreach_set("use_smooth", [True] * len(me.polygons))
+    me.update()
+
+def setup_displaced_edges(ob, uv_name):
+    fmd = ensure_modifier(ob, 'FRACTURE', "Fracture")
+    smd = ensure_modifier(ob, 'SUBSURF', "Subsurf")
+    dmd = ensure_modifier(ob, 'DISPLACE', "Displace")
+    emd = ensure_modifier(ob, 'EDGE_SPLIT', "EdgeSplit")
+    
+    tex = ensure_texture()
+     
+    fmd.use_smooth = True
+    fmd.uv_layer = uv_name
+    fmd.autohide_dist = 0.0001
+    
+    smd.subdivision_type = 'SIMPLE'
+    smd.levels = 2
+    
+    dmd.texture_coords = 'UV'
+    dmd.uv_layer = uv_name
+    dmd.strength = 0.5
+    dmd.texture = tex
+    
+    emd.split_angle = math.radians(45)
+
+class MergeTexturesOperator(bpy.types.Operator):
+    """Merges displacement textures with identical settings into one"""
+    bl_idname = "fracture.merge_textures"
+    bl_label = "Merge displacement textures"
+    
+    def execute(self, context):
+        #ours only: pooled ones, and the old per object <name>_Displacement ones
+        #still used by a displace modifier of that object
+        ours = {tex.name for tex in bpy.data.textures if "fracture_signature" in tex}
+        for ob in bpy.data.objects:
+            for md in ob.modifiers:
+                if md.type == 'DISPLACE' and md.texture is not None and md.texture.name == ob.name + "_Displacement":
+                    ours.add(md.texture.name)
+        
+        keep = {}
+        merged = 0
+        for tex in sorted(bpy.data.textures, key=lambda t: t.name):
+            if tex.name not in ours:
+                continue
+            
+            sig = texture_signature(tex)
+            if sig not in keep:
+                tex["fracture_signature"] = sig
+                keep[sig] = tex
+            else:
+                tex.user_remap(keep[sig])
+                bpy.data.textures.remove(tex)
+                merged += 1
+        
+        texture_pool.clear()
+        self.report({'INFO'}, "Merged {} textures".format(merged))
+        return {'FINISHED'}
+
 ### Rough edges using displacement modifier:
 class DisplacementEdgesOperator(bpy.types.Operator):
     """Setups the modifier stack for simulated (not real) rough edges"""
     bl_idname = "fracture.create_displaced_edges"
     bl_label = "Simulated rough edges"
+    bl_options = {'REGISTER', 'UNDO'}
     
     def execute(self, context):
         
-        for ob in context.selected_objects:
-            if ob.type != 'MESH':
-                continue
-            
-            fmd = ensure_modifier(ob, 'FRACTURE', "Fracture")
-            smd = ensure_modifier(ob, 'SUBSURF', "Subsurf")
-            dmd = ensure_modifier(ob, 'DISPLACE', "Displace")
-            emd = ensure_modifier(ob, 'EDGE_SPLIT', "EdgeSplit")
-             
-            bpy.ops.object.shade_smooth()
-            uv = ensure_uv(context, ob, "InnerUV")
-            tex = ensure_texture(ob)
-             
-            fmd.use_smooth = True
-            fmd.uv_layer = uv.name
-            fmd.autohide_dist = 0.0001
-            
-            smd.subdivision_type = 'SIMPLE'
-            smd.levels = 2
-            
-            dmd.texture_coords = 'UV'
-            dmd.uv_layer = uv.name
-            dmd.strength = 0.5
-            dmd.texture = tex
-            
-            emd.split_angle = math.radians(45)
-            
-            
+        #configure all first, refresh afterwards
+        obs = [ob for ob in context.selected_objects if ob.type == 'MESH']
+        ensure_uvs(obs, "InnerUV")
+        for me in {ob.data for ob in obs}:
+            shade_smooth(me)
+        for ob in obs:
+            setup_displaced_edges(ob, "InnerUV")
+        
+        #the setup above is finished (and undoable) here, the fracture runs on its own
+        if context.scene.use_background_fracture and len(obs) > 1:
+            bpy.ops.fracture.background_refresh('INVOKE_DEFAULT')
+            return {'FINISHED'}
+        
+        for ob in obs:
+            context.scene.objects.active = ob
             bpy.ops.object.fracture_refresh(modifier="Fracture", reset=True)
 
         return {'FINISHED'}
 
+#runs inside the background blender processes of BackgroundFractureOperator
+fracture_worker_script = """
+import bpy, sys
+argv = sys.argv[sys.argv.index("--") + 1:]
+result, progress, names = argv[0], argv[1], argv[2:]
+scene = bpy.context.scene
+done = set()
+for name in names:
+    ob = bpy.data.objects[name]
+    scene.objects.active = ob
+    bpy.ops.object.fracture_refresh(modifier="Fracture", reset=True)
+    #refresh only flags the modifier, nothing else evaluates in background mode
+    scene.update()
+    done.add(ob)
+    with open(progress, "w") as f:
+        f.write(str(len(done)))
+bpy.data.libraries.write(result, done, fake_user=True)
+"""
+
+# datablock types a written object can drag along
+appended_id_types = ("objects", "meshes", "curves", "materials", "textures", "images", "groups", 
+                     "particles", "actions", "node_groups")
+
+def remap_id_pointers(new, old):
+    """Point the ID properties of struct new to the ones of old"""
+    for k, is_array in rna_schema(new):
+        if isinstance(getattr(new, k), bpy.types.ID):
+            try:
+                setattr(new, k, getattr(old, k))
+            except (AttributeError, TypeError, ValueError):
+                pass
+
+def remove_orphans(before):
+    """Remove datablocks not in before (names per type) which have no users anymore,
+       until nothing is left to remove (groups hold objects, objects hold meshes...)"""
+    removed = True
+    while removed:
+        removed = False
+        for typ in appended_id_types:
+            coll = getattr(bpy.data, typ)
+            for id in list(coll):
+                if id.users == 0 and id.name not in before[typ]:
+                    coll.remove(id)
+                    removed = True
+
+def swap_in_fractured(path, names):
+    """Append the fractured objects of a worker and let them replace the originals.
+       Returns the names of the objects which came back without shards"""
+    before = {typ: set(getattr(bpy.data, typ).keys()) for typ in appended_id_types}
+    with bpy.data.libraries.load(path) as (data_from, data_to):
+        wanted = [n for n in names if n in data_from.objects]
+        data_to.objects = wanted
+    
+    missing = [n for n in names if n not in wanted]
+    for name, new in zip(wanted, data_to.objects):
+        old = bpy.data.objects.get(name)
+        if new is None or old is None:
+            continue
+        
+        md = find_modifier(new, 'FRACTURE')
+        if md is None or len(md.mesh_islands) == 0:
+            #not fractured, keep the original, the copy goes with the orphans
+            new.use_fake_user = False
+            missing.append(name)
+            continue
+        
+        #keep using our datablocks (mesh, parent, FM groups, textures, constraint
+        #targets, materials...), not the appended copies
+        remap_id_pointers(new, old)
+        new.matrix_parent_inverse = old.matrix_parent_inverse.copy()
+        for md in new.modifiers:
+            omd = old.modifiers.get(md.name)
+            if omd is not None:
+                remap_id_pointers(md, omd)
+        for con in new.constraints:
+            ocon = old.constraints.get(con.name)
+            if ocon is not None:
+                remap_id_pointers(con, ocon)
+        for psys in new.particle_systems:
+            opsys = old.particle_systems.get(psys.name)
+            if opsys is not None:
+                remap_id_pointers(psys, opsys)
+        for slot, oslot in zip(new.material_slots, old.material_slots):
+            slot.material = oslot.material
+        
+        new.use_fake_user = False
+        old.user_remap(new)
+        bpy.data.objects.remove(old, do_unlink=True)
+        new.name = name
+    
+    remove_orphans(before)
+    return missing
+
+class BackgroundFractureOperator(bpy.types.Operator):
+    """Refreshes the fracture of all selected objects in parallel background blender processes"""
+    bl_idname = "fracture.background_refresh"
+    bl_label = "Background fracture"
+    
+    timer = None
+    workers = []
+    tempdir = ""
+    total = 0
+    
+    def progress(self):
+        done = 0
+        for proc, names, result, progress in self.workers:
+            try:
+                with open(progress) as f:
+                    done += int(f.read() or 0)
+            except (IOError, ValueError):
+                pass
+        return done
+    
+    def finish(self, context):
+        context.window_manager.event_timer_remove(self.timer)
+        context.window_manager.progress_end()
+        context.area.header_text_set()
+        shutil.rmtree(self.tempdir, ignore_errors=True)
+    
+    def modal(self, context, event):
+        if event.type == 'ESC':
+            for proc, names, result, progress in self.workers:
+                proc.kill()
+            self.finish(context)
+            self.report({'WARNING'}, "Background fracture cancelled")
+            return {'CANCELLED'}
+        
+        if event.type != 'TIMER':
+            return {'PASS_THROUGH'}
+        
+        done = self.progress()
+        context.window_manager.progress_update(done)
+        context.area.header_text_set("Fracturing in background: {} / {} objects, ESC to cancel".format(done, self.total))
+        
+        if any(proc.poll() is None for proc, names, result, progress in self.workers):
+            return {'PASS_THROUGH'}
+        
+        failed = []
+        for proc, names, result, progress in self.workers:
+            if proc.returncode == 0 and os.path.exists(result):
+                failed.extend(swap_in_fractured(result, names))
+            else:
+                failed.extend(names)
+        
+        self.finish(context)
+        if len(failed) > 0:
+            #fracture those here instead
+            for name in failed:
+                ob = bpy.data.objects.get(name)
+                if ob is not None:
+                    context.scene.objects.active = ob
+                    bpy.ops.object.fracture_refresh(modifier="Fracture", reset=True)
+            self.report({'WARNING'}, "{} objects came back unfractured, refreshed them here".format(len(failed)))
+        else:
+            self.report({'INFO'}, "Fractured {} objects".format(self.total))
+        
+        return {'FINISHED'}
+    
+    def invoke(self, context, event):
+        names = [ob.name for ob in context.selected_objects if find_modifier(ob, 'FRACTURE') is not None]
+        if len(names) == 0:
+            self.report({'WARNING'}, "Need selected objects with fracture modifier")
+            return {'CANCELLED'}
+        
+        #workers start from a copy of the current state, including unsaved changes
+        self.tempdir = tempfile.mkdtemp(prefix="fracture_")
+        blend = os.path.join(self.tempdir, "scene.blend")
+        bpy.ops.wm.save_as_mainfile(filepath=blend, copy=True)
+        
+        count = min(context.scene.fracture_workers, len(names))
+        self.workers = []
+        self.total = len(names)
+        for i in range(count):
+            chunk = names[i::count]
+            result = os.path.join(self.tempdir, "result{}.blend".format(i))
+            progress = os.path.join(self.tempdir, "progress{}.txt".format(i))
+            proc = subprocess.Popen([bpy.app.binary_path, "--factory-startup", "-b", blend, 
+                                     "--python-expr", fracture_worker_script, "--", result, progress] + chunk,
+                                     stdout=subprocess.DEVNULL)
+            self.workers.append((proc, chunk, result, progress))
+        
+        context.window_manager.progress_begin(0, self.total)
+        self.timer = context.window_manager.event_timer_add(0.5, context.window)
+        context.window_manager.modal_handler_add(self)
+        return {'RUNNING_MODAL'}
+
+# FM settings which change the fracture result, runtime state like refresh is left out
+combine_hash_settings = ("frac_algorithm", "shard_count", "point_source", "point_seed", "percentage", 
+                         "extra_group", "cutter_group", "dm_group", "cluster_count", "cluster_group", 
+                         "use_particle_birth_coordinates", "splinter_axis", "splinter_length", "shards_to_islands", 
+                         "fractal_cuts", "fractal_amount", "fractal_iterations", "physics_mesh_scale", 
+                         "use_greasepencil_edges", "grease_offset", "grease_decimate", "cutter_axis", 
+                         "use_smooth", "uv_layer", "inner_material", "autohide_dist", "automerge_dist", "fix_normals", 
+                         "thresh_vertex_group", "ground_vertex_group", "inner_vertex_group", 
+                         "use_constraints", "use_constraint_group", "constraint_limit", "contact_dist", "constraint_target", 
+                         "use_mass_dependent_thresholds", "use_compounds")
+
+def combine_hash(ob, md):
+    """Checksum over the mesh and the fracture input settings of ob, to tell whether its fracture is current"""
+    me = ob.data
+    co = np.empty(len(me.vertices) * 3, dtype=np.float32)
+    me.vertices.foreach_get("co", co)
+    loops = np.empty(len(me.loops), dtype=np.int32)
+    me.loops.foreach_get("vertex_index", loops)
+    settings = []
+    for k in combine_hash_settings:
+        v = getattr(md, k, None)
+        if isinstance(v, bpy.types.ID):
+            v = v.name
+        elif isinstance(v, set):
+            v = sorted(v)
+        settings.append((k, v))
+    
+    h = zlib.crc32(co.tobytes())
+    h = zlib.crc32(loops.tobytes(), h)
+    h = zlib.crc32(repr(settings).encode(), h)
+    #ID properties only hold 32 bit signed ints
+    return str(h)
+
+def find_connector(ob, constraints_only):
+    """FM of ob, if ob is a connector of the given kind"""
+    if ob is None:
+        return None
+    md = find_modifier(ob, 'FRACTURE')
+    if md is None or md.dm_group is None or md.use_constraint_group != constraints_only:
+        return None
+    return md
+
+def add_combine_member(context, gr, ob, constraints_only):
+    gr.objects.link(ob)
+    #remember what we change, for remove_combine_member
+    ob["fm_combine_layers"] = [int(l) for l in ob.layers]
+    if ob.rigid_body is not None:
+        ob["fm_combine_rb"] = [int(ob.rigid_body.kinematic), int(ob.rigid_body.is_ghost)]
+    
+    md = find_modifier(ob, 'FRACTURE')
+    if md is not None:
+        ob["fm_combine_constraints"] = int(md.use_constraints)
+        md.use_constraints = constraints_only
+        #only refresh if the fracture isnt current anyway, the hash is taken from
+        #the inputs, refresh itself only flags the modifier
+        h = combine_hash(ob, md)
+        if ob.get("fm_combine_hash") != h or len(md.mesh_islands) == 0:
+            context.scene.objects.active = ob
+            bpy.ops.object.fracture_refresh(reset=True)
+            ob["fm_combine_hash"] = h
+    
+    if ob.rigid_body is not None and (md is None or constraints_only == False):
+        #stop simulation and interaction
+        #for regular rigidbodies unsure, doesnt work without FM here, keep as is
+        ob.rigid_body.kinematic = True
+        ob.rigid_body.is_ghost = True
+    
+    if (constraints_only == False):
+        ob.layers = [x == 17 for x in range(19)] + [ob.layers[19]]
+
+def remove_combine_member(context, gr, ob):
+    gr.objects.unlink(ob)
+    if "fm_combine_layers" in ob:
+        ob.layers = [bool(l) for l in ob["fm_combine_layers"]]
+        del ob["fm_combine_layers"]
+    if "fm_combine_rb" in ob:
+        if ob.rigid_body is not None:
+            ob.rigid_body.kinematic, ob.rigid_body.is_ghost = [bool(v) for v in ob["fm_combine_rb"]]
+        del ob["fm_combine_rb"]
+    if "fm_combine_constraints" in ob:
+        md = find_modifier(ob, 'FRACTURE')
+        if md is not None and md.use_constraints != bool(ob["fm_combine_constraints"]):
+            md.use_constraints = bool(ob["fm_combine_constraints"])
+            context.scene.objects.active = ob
+            bpy.ops.object.fracture_refresh(reset=True)
+        del ob["fm_combine_constraints"]
+
+def make_connector(context, gr, constraints_only):
+    #create carrier object at 0, 0, 0 -> transformations are taken into account
+    me = bpy.data.meshes.new("FM-GroupConnector")
+    bm = bmesh.new()
+    bmesh.ops.create_cube(bm, size=2.0)
+    bm.to_mesh(me)
+    bm.free()
+    
+    active = bpy.data.objects.new("FM-GroupConnector", me)
+    context.scene.objects.link(active)
+    if (constraints_only == False):
+        active.layers = [x == 0 for x in range(20)]
+    else:
+        context.scene.layers[19] = True
+        active.layers = [x == 19 for x in range(20)]
+        active.show_x_ray = True
+        active.draw_type = 'BOUNDS'
+        active.show_name = True
+    
+    md = active.modifiers.new(type='FRACTURE', name="Fracture")
+    md.point_source = set()
+    md.dm_group = gr
+    md.use_constraint_group = constraints_only
+    md.use_constraints = constraints_only
+    return active
+
 class CombineSubObjectsOperator(bpy.types.Operator):
     """Combine multiple Fractured objects into one object or connect with external constraints"""
     bl_idname = "fracture.combine_subobjects"
@@ -1159,44 +2080,25 @@ class CombineSubObjectsOperator(bpy.types.Operator):
     constraints_only = bpy.props.BoolProperty(name="constraints_only", default=False)
     
     def execute(self, context):
+        #with an existing connector active, only add the new objects to its group
+        active = context.active_object
+        connector = find_connector(active, self.constraints_only)
+        
         #prepare objects
         if (self.constraints_only == False):
             context.scene.layers[17] = True
         
-        if self.constraints_only:
+        if connector is not None:
+            gr = connector.dm_group
+        elif self.constraints_only:
             gr = bpy.data.groups.new("ConnectorGroup")
         else:
             gr = bpy.data.groups.new("CombinationGroup")
             
         for ob in context.selected_objects:
-
-             gr.objects.link(ob)
-             context.scene.objects.active = ob
-             modFound = False
-             for md in ob.modifiers:
-                if (md.type == 'FRACTURE'):
-                   md.use_constraints = self.constraints_only    
-                   bpy.ops.object.fracture_refresh(reset=True)
-                   
-                   if (self.constraints_only == False):
-                        #stop simulation and interaction
-                        ob.rigid_body.kinematic = True
-                        ob.rigid_body.is_ghost = True
-                        
-                   modFound = True     
-                   break
-                    
-             if not modFound and ob.rigid_body != None:
-                #stop simulation and interaction (regular rigidbodies)
-                #unsure, doesnt work without FM here, keep as is
-                ob.rigid_body.kinematic = True
-                ob.rigid_body.is_ghost = True
-             
-             if (self.constraints_only == False):       
-                ob.layers[17] = True
-                for x in range(0, 19):
-                    if x != 17:
-                        ob.layers[x] = False
+            if connector is not None and (ob == active or ob.name in gr.objects):
+                continue
+            add_combine_member(context, gr, ob, self.constraints_only)
         
         #context.scene.update()
         if (self.constraints_only == False):
@@ -1205,28 +2107,51 @@ class CombineSubObjectsOperator(bpy.types.Operator):
         if len(gr.objects) == 0:
             self.report({'WARNING'}, "Found no selected object with a fracture modifier") 
             return {'CANCELLED'}
-                 
-        #create carrier object at 0, 0, 0 -> transformations are taken into account
-        bpy.ops.mesh.primitive_cube_add()
-        active = context.active_object
-        active.name = "FM-GroupConnector"
-        if (self.constraints_only == False):
-            active.layers[0] = True
-            active.layers[17] = False
-        else:
-            context.scene.layers[19] = True
-            active.layers[19] = True
-            active.layers[0] = False
-            active.show_x_ray = True
-            active.draw_type = 'BOUNDS'
-            active.show_name = True
-        
-        bpy.ops.object.modifier_add(type='FRACTURE')
-        md = active.modifiers["Fracture"]
-        md.point_source = set()
-        md.dm_group = gr
-        md.use_constraint_group = self.constraints_only
-        md.use_constraints = self.constraints_only
+        
+        if connector is None:
+            active = make_connector(context, gr, self.constraints_only)
+        
+        context.scene.objects.active = active
+        bpy.ops.object.fracture_refresh(reset=True)
+        
+        return {'FINISHED'}
+
+class ConnectorMembersOperator(bpy.types.Operator):
+    """Adds the selected objects to or removes them from the active connector and rebuilds it"""
+    bl_idname = "fracture.connector_members"
+    bl_label = "Connector Members"
+    
+    remove = bpy.props.BoolProperty(name="remove", default=False)
+    
+    def execute(self, context):
+        connector = context.active_object
+        md = None
+        if connector is not None:
+            md = find_modifier(connector, 'FRACTURE')
+        if md is None or md.dm_group is None:
+            self.report({'WARNING'}, "Need an active FM-GroupConnector")
+            return {'CANCELLED'}
+        
+        gr = md.dm_group
+        count = 0
+        for ob in context.selected_objects:
+            if ob == connector:
+                continue
+            if self.remove and ob.name in gr.objects:
+                remove_combine_member(context, gr, ob)
+                count += 1
+            elif not self.remove and ob.name not in gr.objects:
+                add_combine_member(context, gr, ob, md.use_constraint_group)
+                count += 1
+        
+        if count == 0:
+            self.report({'WARNING'}, "No selected objects to add or remove")
+            return {'CANCELLED'}
+        
+        #FM cant add shards of new members to an existing connector or drop single
+        #constraints from python, so the connector is rebuilt as a whole. The other
+        #members arent refreshed
+        context.scene.objects.active = connector
         bpy.ops.object.fracture_refresh(reset=True)
         
         return {'FINISHED'}
@@ -1348,6 +2273,7 @@ class SmokeSetupOperator(bpy.types.Operator):
                 #pdata = bpy.data.particles[-1]
                 pdata = psys.settings
                 psys.name = psys_name;
+                psys.seed = helper_seed(context.scene, ob.name + psys_name)
                 pdata.name = "SMOKE_Settings"
                 pdata.count = 25000
                 
@@ -1476,6 +2402,7 @@ class DustSetupOperator(bpy.types.Operator):
         loc = ob.location.copy()
         x = 0.0
         gr = bpy.data.groups.new(actname + "_DustObjects")
+        rng = helper_random(context.scene, actname + "_DustObjects")
         
         context.scene.layers[17] = True
         bpy.ops.object.empty_add(type='CIRCLE', view_align=False, location=loc.to_tuple())
@@ -1487,7 +2414,7 @@ class DustSetupOperator(bpy.types.Operator):
         for i in range(dust_count):
             #random size (0 bis 1) and 
             #translation by double size to X direction (to let it look good)
-            size = random.random() * 0.5 + 0.5
+            size = rng.random() * 0.5 + 0.5
             x += 1.5 * size
             context.scene.layers[17] = True
             bpy.ops.mesh.primitive_ico_sphere_add(size=size, location=(loc[0] + x, loc[1], loc[2]))
@@ -1573,6 +2500,7 @@ class DustSetupOperator(bpy.types.Operator):
                 #pdata = bpy.data.particles[-1]
                 pdata = psys.settings
                 psys.name = psys_name;
+                psys.seed = helper_seed(context.scene, ob.name + psys_name)
                 pdata.name = "DUST_Settings"
                 pdata.count = 2500
                 
@@ -1669,6 +2597,7 @@ class DebrisSetupOperator(bpy.types.Operator):
         loc = ob.location.copy()
         x = 0.0
         gr = bpy.data.groups.new(actname + "_DebrisObjects")
+        rng = helper_random(context.scene, actname + "_DebrisObjects")
         
         context.scene.layers[17] = True
         bpy.ops.object.empty_add(type='CIRCLE', view_align=False, location=loc.to_tuple())
@@ -1680,7 +2609,7 @@ class DebrisSetupOperator(bpy.types.Operator):
         for i in range(debris_count):
             #random size (0 to 1) and 
             #translation by double size in X direction (only for the "Optics", let it look "good")
-            size = random.random() * 0.5 + 0.5
+            size = rng.random() * 0.5 + 0.5
             x += 3 * size
             context.scene.layers[17] = True
             bpy.ops.mesh.primitive_ico_sphere_add(size=size, location=(loc[0] + x, loc[1], loc[2]), subdivisions=1)
@@ -1691,8 +2620,8 @@ class DebrisSetupOperator(bpy.types.Operator):
                 
             #subdivide fractally in editmode (2x) -> looks (usually) better than 1x with 2 cuts
             bpy.ops.object.editmode_toggle()
-            bpy.ops.mesh.subdivide(number_cuts=1, fractal=size*2.5, seed=random.randint(0,10))
-            bpy.ops.mesh.subdivide(number_cuts=1, fractal=size*2.5, seed=random.randint(0,10))    
+            bpy.ops.mesh.subdivide(number_cuts=1, fractal=size*2.5, seed=rng.randint(0,10))
+            bpy.ops.mesh.subdivide(number_cuts=1, fractal=size*2.5, seed=rng.randint(0,10))    
             #add in objectmode to group 
             bpy.ops.object.editmode_toggle()
             gr.objects.link(context.active_object)
@@ -1763,6 +2692,7 @@ class DebrisSetupOperator(bpy.types.Operator):
                 #pdata = bpy.data.particles[-1]
                 pdata = psys.settings
                 psys.name = psys_name;
+                psys.seed = helper_seed(context.scene, ob.name + psys_name)
                 pdata.name = "DEBRIS_Settings"
                 pdata.count = 1000
                 
@@ -1849,6 +2779,56 @@ class MoveFMToTopOperator(bpy.types.Operator):
             bpy.ops.object.modifier_move_up(modifier="Fracture")
         return {'FINISHED'}
 
+def write_fcurve(action, path, index, frames, values, group="", clean=False):
+    """Replace the F-curve at path / index with keys at frames, added in one go.
+       With clean, keys with the same value as both neighbours are left out"""
+    fc = action.fcurves.find(data_path=path, index=index)
+    if fc is not None:
+        action.fcurves.remove(fc)
+    
+    if clean and len(values) > 2:
+        same = np.isclose(values[1:-1], values[:-2], atol=1e-6) & np.isclose(values[1:-1], values[2:], atol=1e-6)
+        keep = np.concatenate(([True], ~same, [True]))
+        frames = frames[keep]
+        values = values[keep]
+    
+    fc = action.fcurves.new(path, index, group)
+    co = np.empty(len(frames) * 2, dtype=np.float32)
+    co[0::2] = frames
+    co[1::2] = values
+    fc.keyframe_points.add(len(frames))
+    fc.keyframe_points.foreach_set("co", co)
+    #recalculates the handles
+    fc.update()
+    return fc
+
+def copy_fcurve(src, action, path, index=0, scale=1.0):
+    """Replace the F-curve at path / index with the keys of src, values scaled.
+       Interpolation and handles are kept"""
+    fc = action.fcurves.find(data_path=path, index=index)
+    if fc is not None:
+        action.fcurves.remove(fc)
+    
+    fc = action.fcurves.new(path, index)
+    n = len(src.keyframe_points)
+    fc.keyframe_points.add(n)
+    for k, sk in zip(fc.keyframe_points, src.keyframe_points):
+        k.interpolation = sk.interpolation
+        k.easing = sk.easing
+        k.handle_left_type = sk.handle_left_type
+        k.handle_right_type = sk.handle_right_type
+    
+    #positions after the handle types, setting those moves the handles
+    for attr in ("co", "handle_left", "handle_right"):
+        co = np.empty(n * 2, dtype=np.float32)
+        src.keyframe_points.foreach_get(attr, co)
+        co[1::2] *= scale
+        fc.keyframe_points.foreach_set(attr, co)
+    
+    fc.extrapolation = src.extrapolation
+    fc.update()
+    return fc
+
 def delete_keyframes(context, ob, path, index=1):
     if ob.animation_data and ob.animation_data.action:
         fc = ob.animation_data.action.fcurves
@@ -1987,6 +2967,7 @@ class SmokeDebrisDustSetupPanel(bpy.types.Panel):
         row = col.row(align=True)
         row.prop(context.scene, "emit_start", text="All Emissions Start")
         row.prop(context.scene, "emit_end", text="All Emissions End")
+        col.prop(context.scene, "fracture_seed", text="Seed")
         if context.object and context.object.particle_systems.active:
             row = col.row(align=True)
             row.prop(context.object.particle_systems.active.settings, "lifetime", text="Lifetime (Only Active PSystem)")
@@ -2037,42 +3018,99 @@ class ExecuteFractureOperator(bpy.types.Operator):
         
         return {'FINISHED'}
 
+# what time_scale drives in a scene, as (kind, name, modifier name), see
+# get_timescale_targets(). Only names are kept, the structs are looked up on use.
+# Rebuilt lazily after objects or particle settings were added or removed, the
+# active object changed its data, and after undo / load
+timescale_registry = {"scene": None, "count": -1, "particles": -1, "targets": None}
+
+def find_timescale_targets(scene):
+    targets = []
+    settings = set()
+    for o in scene.objects:
+        md = find_modifier(o, 'FLUID_SIMULATION')
+        if md is not None and md.settings.type == 'DOMAIN':
+            targets.append(('FLUID', o.name, md.name))
+            
+        md = find_modifier(o, 'SMOKE')
+        if md is not None and md.smoke_type == 'DOMAIN':
+            targets.append(('SMOKE', o.name, md.name))
+        
+        #GAH take ALL particlesystems per object into account, but each settings once
+        for md in o.modifiers:
+            if md.type == 'PARTICLE_SYSTEM' and md.particle_system.settings.physics_type == 'NEWTON':
+                ps = md.particle_system.settings
+                if ps.name not in settings:
+                    settings.add(ps.name)
+                    targets.append(('PARTICLES', ps.name, ""))
+        
+        #FLIP Fluid compat
+        if hasattr(o, "flip_fluid"):
+            if hasattr(o.flip_fluid, "domain"):
+                targets.append(('FLIP', o.name, ""))
+    
+    return targets
+
+def resolve_timescale_target(scene, kind, name, mdname):
+    """(owner, data, attr, data_path, factor, default) of a registry entry, None if
+       it isnt a time scale target anymore"""
+    if kind == 'PARTICLES':
+        ps = bpy.data.particles.get(name)
+        if ps is None or ps.physics_type != 'NEWTON':
+            return None
+        return (ps, ps, "timestep", "timestep", 0.04, 0.04)
+    
+    o = scene.objects.get(name)
+    if o is None:
+        return None
+    
+    if kind == 'FLIP':
+        if not hasattr(o, "flip_fluid") or not hasattr(o.flip_fluid, "domain"):
+            return None
+        return (o, o.flip_fluid.domain.simulation, "time_scale", "flip_fluid.domain.simulation.time_scale", 1.0, 1.0)
+    
+    md = o.modifiers.get(mdname)
+    if kind == 'FLUID' and md is not None and md.type == 'FLUID_SIMULATION' and md.settings.type == 'DOMAIN':
+        return (o, md.settings, "simulation_rate", "modifiers[\""+md.name+"\"].settings.simulation_rate", 1.0, 1.0)
+    if kind == 'SMOKE' and md is not None and md.type == 'SMOKE' and md.smoke_type == 'DOMAIN':
+        return (o, md.domain_settings, "time_scale", "modifiers[\""+md.name+"\"].domain_settings.time_scale", 1.0, 1.0)
+    return None
+
+def get_timescale_targets(scene):
+    """(owner, data, attr, data_path, factor, default) per time scale target: data.attr
+       is set to time_scale / 100 * factor, owner is the ID which gets the keyframes"""
+    reg = timescale_registry
+    if reg["targets"] is None or reg["scene"] != scene.name or reg["count"] != len(scene.objects) \
+        or reg["particles"] != len(bpy.data.particles):
+        reg.update(scene=scene.name, count=len(scene.objects), particles=len(bpy.data.particles), 
+                   targets=find_timescale_targets(scene))
+    
+    targets = []
+    for entry in reg["targets"]:
+        target = resolve_timescale_target(scene, *entry)
+        if target is None:
+            #removed or changed, find them again next time
+            reg["targets"] = None
+            continue
+        targets.append(target)
+    
+    #special case rigidbody, this is located at context.scene.rigidbody_world
+    if scene.rigidbody_world is not None:
+        targets.append((scene, scene.rigidbody_world, "time_scale", "rigidbody_world.time_scale", 1.0, 1.0))
+    return targets
+
 class SetTimeScaleOperator(bpy.types.Operator):
     """Sets time scale keyframes..."""
     bl_idname = "fracture.set_timescale"
     bl_label = "Set Time Scale"
     
     def execute(self, context):
+        scene = context.scene
+        scene.keyframe_insert(data_path="time_scale")
         
-        bpy.context.scene.keyframe_insert(data_path="time_scale")
-            
-        for o in bpy.context.scene.objects:
-            md = find_modifier(o, 'FLUID_SIMULATION')
-            if md is not None and md.settings.type == 'DOMAIN':
-                md.settings.simulation_rate = bpy.context.scene.time_scale / 100
-                o.keyframe_insert(data_path="modifiers[\""+md.name+"\"].settings.simulation_rate")
-                
-            md = find_modifier(o, 'SMOKE')
-            if md is not None and md.smoke_type == 'DOMAIN':
-                md.domain_settings.time_scale = bpy.context.scene.time_scale / 100
-                o.keyframe_insert(data_path="modifiers[\""+md.name+"\"].domain_settings.time_scale")
-            
-            #GAH take ALL particlesystems per object into account     
-            for md in o.modifiers:
-                if md.type == 'PARTICLE_SYSTEM' and md.particle_system.settings.physics_type == 'NEWTON':
-                    md.particle_system.settings.timestep = bpy.context.scene.time_scale / 100 * 0.04
-                    md.particle_system.settings.keyframe_insert(data_path="timestep")
-                
-            #FLIP Fluid compat    
-            if hasattr(o, "flip_fluid"):
-                if hasattr(o.flip_fluid, "domain"):
-                    o.flip_fluid.domain.simulation.time_scale = bpy.context.scene.time_scale / 100
-                    o.keyframe_insert(data_path="flip_fluid.domain.simulation.time_scale") 
-    
-        #special case rigidbody, this is located at context.scene.rigidbody_world
-        if bpy.context.scene.rigidbody_world is not None:
-           bpy.context.scene.rigidbody_world.time_scale = bpy.context.scene.time_scale / 100    
-           bpy.context.scene.keyframe_insert(data_path="rigidbody_world.time_scale")
+        for owner, data, attr, path, factor, default in get_timescale_targets(scene):
+            setattr(data, attr, scene.time_scale / 100 * factor)
+            owner.keyframe_insert(data_path=path)
         
         return {'FINISHED'}
            
@@ -2082,44 +3120,15 @@ class ClearTimeScaleOperator(bpy.types.Operator):
     bl_label = "Clear Time Scale"
     
     def execute(self, context):
-        
+        scene = context.scene
         try:
-            bpy.context.scene.keyframe_delete(data_path="time_scale")
+            scene.keyframe_delete(data_path="time_scale")
         except RuntimeError:
             pass
-            
-        for o in bpy.context.scene.objects:
-            md = find_modifier(o, 'FLUID_SIMULATION')
-            if md is not None and md.settings.type == 'DOMAIN':
-                try:
-                    o.keyframe_delete(data_path="modifiers[\""+md.name+"\"].settings.simulation_rate")
-                except RuntimeError: # silent fail in case of no animation is present
-                    pass
-                
-            md = find_modifier(o, 'SMOKE')
-            if md is not None and md.smoke_type == 'DOMAIN':
-                try:
-                    o.keyframe_delete(data_path="modifiers[\""+md.name+"\"].domain_settings.time_scale")
-                except RuntimeError: # silent fail in case of no animation is present
-                    pass
-            
-            #GAH take ALL particlesystems per object into account     
-            for md in o.modifiers:
-                if md.type == 'PARTICLE_SYSTEM' and md.particle_system.settings.physics_type == 'NEWTON':
-                    try:
-                        md.particle_system.settings.keyframe_delete(data_path="timestep")
-                    except RuntimeError: # silent fail in case of no animation is present
-                        pass 
-                
-            #FLIP Fluid compat    
-            if hasattr(o, "flip_fluid"):
-                if hasattr(o.flip_fluid, "domain"):
-                    o.keyframe_delete(data_path="flip_fluid.domain.simulation.time_scale")
-    
-        #special case rigidbody, this is located at context.scene.rigidbody_world
-        if bpy.context.scene.rigidbody_world is not None:
+        
+        for owner, data, attr, path, factor, default in get_timescale_targets(scene):
             try:
-                bpy.context.scene.keyframe_delete(data_path="rigidbody_world.time_scale")
+                owner.keyframe_delete(data_path=path)
             except RuntimeError: # silent fail in case of no animation is present
                 pass
             
@@ -2131,47 +3140,14 @@ class ClearAllTimeScaleOperator(bpy.types.Operator):
     bl_label = "Clear All Time Scale"
     
     def execute(self, context):
+        scene = context.scene
+        delete_keyframes(context, scene, "time_scale")
+        scene.time_scale = 100
         
-        delete_keyframes(bpy.context, bpy.context.scene, "time_scale")
-        bpy.context.scene.time_scale = 100
-            
-        for o in bpy.context.scene.objects:
-            md = find_modifier(o, 'FLUID_SIMULATION')
-            if md is not None and md.settings.type == 'DOMAIN':
-                md.settings.simulation_rate = 1.0
-                try:
-                    delete_keyframes(bpy.context, o, "modifiers[\""+md.name+"\"].settings.simulation_rate")
-                except RuntimeError: # silent fail in case of no animation is present
-                    pass
-                
-            md = find_modifier(o, 'SMOKE')
-            if md is not None and md.smoke_type == 'DOMAIN':
-                md.domain_settings.time_scale = 1.0
-                try:
-                    delete_keyframes(bpy.context, o, "modifiers[\""+md.name+"\"].domain_settings.time_scale")
-                except RuntimeError: # silent fail in case of no animation is present
-                    pass
-            
-            #GAH take ALL particlesystems per object into account     
-            for md in o.modifiers: 
-                if md.type == 'PARTICLE_SYSTEM' and md.particle_system.settings.physics_type == 'NEWTON':
-                    md.particle_system.settings.timestep = 0.04
-                    try:
-                        delete_keyframes(bpy.context, md.particle_system.settings, "timestep")
-                    except RuntimeError: # silent fail in case of no animation is present
-                        pass
-            
-            #FLIP Fluid compat    
-            if hasattr(o, "flip_fluid"):
-                if hasattr(o.flip_fluid, "domain"):
-                    o.flip_fluid.domain.simulation.time_scale = 1.0
-                    delete_keyframes(bpy.context, o, "flip_fluid.domain.simulation.time_scale") 
-    
-        #special case rigidbody, this is located at context.scene.rigidbody_world
-        if bpy.context.scene.rigidbody_world is not None:
-            bpy.context.scene.rigidbody_world.time_scale = 1.0
+        for owner, data, attr, path, factor, default in get_timescale_targets(scene):
+            setattr(data, attr, default)
             try:
-                delete_keyframes(bpy.context, bpy.context.scene, "rigidbody_world.time_scale")
+                delete_keyframes(context, owner, path)
             except RuntimeError: # silent fail in case of no animation is present
                 pass
             
@@ -2183,75 +3159,132 @@ class ApplyTimeScaleOperator(bpy.types.Operator):
     bl_label = "Apply Time Scale"
     
     def execute(self, context):
-        anim = bpy.context.scene.animation_data
-        if anim is None:
+        scene = context.scene
+        anim = scene.animation_data
+        if anim is None or anim.action is None:
             return {'CANCELLED'}
         
-        action = anim.action
-        if action is None:
+        src = anim.action.fcurves.find(data_path="time_scale")
+        if src is None:
             return {'CANCELLED'}
-            
-        for fc in action.fcurves:
-            if fc.data_path == 'time_scale':
-                for keyf in fc.keyframe_points:
-                    bpy.context.scene.frame_set(keyf.co[0])
-                     
-                    for o in bpy.context.scene.objects:
-                        md = find_modifier(o, 'FLUID_SIMULATION')
-                        if md is not None and md.settings.type == 'DOMAIN':
-                            md.settings.simulation_rate = keyf.co[1] / 100 
-                            o.keyframe_insert(data_path="modifiers[\""+md.name+"\"].settings.simulation_rate")
-                            
-                        md = find_modifier(o, 'SMOKE')
-                        if md is not None and md.smoke_type == 'DOMAIN':
-                            md.domain_settings.time_scale = keyf.co[1] / 100
-                            o.keyframe_insert(data_path="modifiers[\""+md.name+"\"].domain_settings.time_scale")
-                             
-                        #GAH take ALL particlesystems per object into account     
-                        for md in o.modifiers:
-                            if md.type == 'PARTICLE_SYSTEM' and md.particle_system.settings.physics_type == 'NEWTON':
-                                md.particle_system.settings.timestep = keyf.co[1] / 100 * 0.04
-                                md.particle_system.settings.keyframe_insert(data_path="timestep")
-                            
-                        #FLIP Fluid compat    
-                        if hasattr(o, "flip_fluid"):
-                            if hasattr(o.flip_fluid, "domain"):
-                                o.flip_fluid.domain.simulation.time_scale = keyf.co[1] / 100
-                                o.keyframe_insert(data_path="flip_fluid.domain.simulation.time_scale") 
-                
-                    #special case rigidbody, this is located at context.scene.rigidbody_world
-                    if bpy.context.scene.rigidbody_world is not None:
-                       bpy.context.scene.rigidbody_world.time_scale = keyf.co[1] / 100    
-                       bpy.context.scene.keyframe_insert(data_path="rigidbody_world.time_scale")
         
-        bpy.context.scene.frame_set(1)
+        #copy the whole curve to every target, no frame changes needed
+        for owner, data, attr, path, factor, default in get_timescale_targets(scene):
+            if owner.animation_data is None:
+                owner.animation_data_create()
+            if owner.animation_data.action is None:
+                owner.animation_data.action = bpy.data.actions.new(owner.name + "Action")
+            copy_fcurve(src, owner.animation_data.action, path, 0, factor / 100)
         
         return {'FINISHED'}
             
-def update_timescale(self, context):
-    if bpy.context.object is None:
+# last time scale set by the slider, applied by fracture_scene_update once
+# it didnt change for timescale_delay seconds (dragging, typing)
+timescale_pending = {"scene": None, "value": 100, "time": 0.0}
+timescale_delay = 0.1
+
+def apply_timescale(scene, value):
+    if scene is None:
         return
     
-    for o in bpy.context.scene.objects:
-        md = find_modifier(o, 'FLUID_SIMULATION')
-        if md is not None and md.settings.type == 'DOMAIN':
-            md.settings.simulation_rate = bpy.context.object.time_scale / 100 
-        md = find_modifier(o, 'SMOKE')
-        if md is not None and md.smoke_type == 'DOMAIN':
-            md.domain_settings.time_scale = bpy.context.object.time_scale / 100 
-        #GAH take ALL particlesystems per object into account     
-        for md in o.modifiers:
-            if md.type == 'PARTICLE_SYSTEM' and md.particle_system.settings.physics_type == 'NEWTON':
-                md.particle_system.settings.timestep = bpy.context.object.time_scale / 100 * 0.04
-            
-        # FLIP FLUID compat
-        if hasattr(o, "flip_fluid"):
-            if hasattr(o.flip_fluid, "domain"):
-                o.flip_fluid.domain.simulation.time_scale = bpy.context.object.time_scale / 100 
+    for owner, data, attr, path, factor, default in get_timescale_targets(scene):
+        v = value / 100 * factor
+        if abs(getattr(data, attr) - v) > 1e-6:
+            setattr(data, attr, v)
+
+def sample_fcurve(fc, frames, steps=16):
+    """Values of fc at frames, from its keys and handles with NumPy instead of
+       evaluating the scene. Bezier segments are sampled along their curve
+       parameter, linear and constant ones are written as bezier too"""
+    n = len(fc.keyframe_points)
+    interp = [k.interpolation for k in fc.keyframe_points]
+    if n < 2 or len(fc.modifiers) > 0 or not set(interp).issubset({'CONSTANT', 'LINEAR', 'BEZIER'}):
+        #easing types and modifiers arent worth it, let the curve do it
+        return np.array([fc.evaluate(f) for f in frames], dtype=np.float64)
+    
+    pts = {}
+    for attr in ("co", "handle_left", "handle_right"):
+        co = np.empty(n * 2, dtype=np.float32)
+        fc.keyframe_points.foreach_get(attr, co)
+        pts[attr] = co.reshape(n, 2).astype(np.float64)
+    
+    p0 = pts["co"][:-1]
+    p3 = pts["co"][1:]
+    p1 = pts["handle_right"][:-1].copy()
+    p2 = pts["handle_left"][1:].copy()
+    kind = np.array(interp[:-1])
+    
+    lin = kind != 'BEZIER'
+    p1[lin] = p0[lin] + (p3[lin] - p0[lin]) / 3
+    p2[lin] = p0[lin] + (p3[lin] - p0[lin]) * 2 / 3
+    const = kind == 'CONSTANT'
+    p1[const, 1] = p2[const, 1] = p0[const, 1]
+    p3 = p3.copy()
+    p3[const, 1] = p0[const, 1]
+    
+    t = np.linspace(0.0, 1.0, steps)[None, :, None]
+    u = 1.0 - t
+    curve = u**3 * p0[:, None] + 3 * u**2 * t * p1[:, None] + 3 * u * t**2 * p2[:, None] + t**3 * p3[:, None]
+    #last key on its own, a constant segment before it ends in a step
+    x = np.maximum.accumulate(np.append(curve[..., 0].ravel(), pts["co"][-1, 0]))
+    y = np.append(curve[..., 1].ravel(), pts["co"][-1, 1])
+    
+    frames = np.asarray(frames, dtype=np.float64)
+    values = np.interp(frames, x, y)
+    if fc.extrapolation == 'LINEAR':
+        left = frames < x[0]
+        right = frames > x[-1]
+        values[left] = y[0] + (frames[left] - x[0]) * (y[1] - y[0]) / max(x[1] - x[0], 1e-6)
+        values[right] = y[-1] + (frames[right] - x[-1]) * (y[-1] - y[-2]) / max(x[-1] - x[-2], 1e-6)
+    
+    return values
+
+def timescale_mapping(scene):
+    """Frames of the scene range and the simulation time (in frames) reached at
+       each of them, following the time_scale keys. None without keys"""
+    anim = scene.animation_data
+    if anim is None or anim.action is None:
+        return None
+    fc = anim.action.fcurves.find(data_path="time_scale")
+    if fc is None or len(fc.keyframe_points) == 0:
+        return None
+    
+    frames = np.arange(scene.frame_start, scene.frame_end + 1, dtype=np.float64)
+    scale = np.clip(sample_fcurve(fc, frames), 0, None) / 100
+    sim = np.concatenate(([0.0], np.cumsum((scale[1:] + scale[:-1]) / 2)))
+    return frames, sim, scale
+
+def draw_timescale_preview(layout, scene):
+    mapping = timescale_mapping(scene)
+    if mapping is None:
+        layout.label(text="No time scale keys")
+        return
     
-    #special case rigidbody, this is located at context.scene.rigidbody_world
-    if bpy.context.scene.rigidbody_world is not None:
-        bpy.context.scene.rigidbody_world.time_scale = bpy.context.object.time_scale / 100
+    frames, sim, scale = mapping
+    length = frames[-1] - frames[0]
+    layout.label(text="Simulated: {:.1f} of {:.0f} frames".format(sim[-1], length))
+    if sim[-1] > 0:
+        layout.label(text="Slow-down: {:.2f}x".format(length / sim[-1]))
+    
+    #rigid body steps scale with the simulated time, smoke steps once per frame
+    if scene.rigidbody_world is not None:
+        per_frame = scene.rigidbody_world.steps_per_second / (scene.render.fps / scene.render.fps_base)
+        layout.label(text="Rigid body steps: {:.0f} (at 100%: {:.0f})".format(sim[-1] * per_frame, length * per_frame))
+    
+    smoke = [t for t in get_timescale_targets(scene) if t[3].endswith("domain_settings.time_scale")]
+    if len(smoke) > 0:
+        layout.label(text="Smoke steps: {:.0f} per domain, min. time scale {:.0f}%".format(length, scale.min() * 100))
+    
+    fc = scene.animation_data.action.fcurves.find(data_path="time_scale")
+    for k in fc.keyframe_points:
+        f = k.co[0]
+        if frames[0] <= f <= frames[-1]:
+            layout.label(text="Frame {:.0f} -> {:.1f}".format(f, np.interp(f, frames, sim) + frames[0]))
+
+def update_timescale(self, context):
+    timescale_pending["scene"] = self.name
+    timescale_pending["value"] = self.time_scale
+    timescale_pending["time"] = time.time()
         
 def update_start_end(self, context):
     for o in bpy.context.scene.objects:
@@ -2827,8 +3860,13 @@ def register():
     bpy.utils.register_class(FractureFrameOperator)
     bpy.utils.register_class(ClusterHelperOperator)
     bpy.utils.register_class(DisplacementEdgesOperator)
+    bpy.utils.register_class(BackgroundFractureOperator)
+    bpy.utils.register_class(MergeTexturesOperator)
     bpy.utils.register_class(CombineSubObjectsOperator)
+    bpy.utils.register_class(ConnectorMembersOperator)
     bpy.utils.register_class(ViewOperatorFracture)
+    bpy.utils.register_class(HelperRecord)
+    bpy.utils.register_class(BatchHelperOperator)
     bpy.utils.register_class(SmokeSetupOperator)
     bpy.utils.register_class(DustSetupOperator)
     bpy.utils.register_class(DebrisSetupOperator)    
@@ -2859,6 +3897,11 @@ def register():
     
     if bpy.context.user_preferences.addons[__name__].preferences.use_pie_menu:
         register_pie_keymaps()
+    
+    bpy.app.handlers.scene_update_post.append(fracture_scene_update)
+    bpy.app.handlers.load_post.append(fracture_clear_caches)
+    bpy.app.handlers.undo_post.append(fracture_clear_caches)
+    bpy.app.handlers.redo_post.append(fracture_clear_caches)
      
     
     bpy.types.Scene.use_animation_curve = bpy.props.BoolProperty(name="use_animation_curve", default=False)
@@ -2866,9 +3909,19 @@ def register():
     bpy.types.Scene.animation_ghost = bpy.props.BoolProperty(name="animation_ghost", default = False)
     bpy.types.Scene.fracture_frame = bpy.props.IntProperty(name="fracture_frame", default=1)
     bpy.types.Scene.is_dynamic = bpy.props.BoolProperty(name="is_dynamic", default=True)
+    bpy.types.Scene.use_bulk_keys = bpy.props.BoolProperty(name="use_bulk_keys", default=False, \
+                                    description="Insert the baked keys of the moving object all at once. The simulation is still stepped frame by frame, only key insertion gets faster")
     bpy.types.Scene.mouse_mode = bpy.props.EnumProperty(name="mouse_mode", items=[("Uniform", "Uniform", "Uniform", 'MESH_CUBE', 0), \
                                                                                    ("Radial", "Radial", "Radial", 'MESH_UVSPHERE', 1)])
                                                                                    
+    bpy.types.Scene.helper_point_mode = bpy.props.EnumProperty(name="helper_point_mode", items=[("Particles", "Particles", "Helpers emit a particle system, read as extra particles", 'MOD_PARTICLES', 0), \
+                                                                                             ("Points", "Points", "Points are sampled into the helper mesh, read as extra vertices", 'PARTICLE_POINT', 1)])
+    bpy.types.Scene.helper_point_count = bpy.props.IntProperty(name="helper_point_count", default=500, min=1)
+    bpy.types.Scene.fracture_seed = bpy.props.IntProperty(name="fracture_seed", default=0, min=0, 
+                                                          description="Seed for helper points, particle systems and debris / dust objects")
+    bpy.types.Scene.use_background_fracture = bpy.props.BoolProperty(name="use_background_fracture", default=False, 
+                                                                     description="Fracture many objects in parallel background processes (experimental, objects returned unfractured are refreshed here)")
+    bpy.types.Scene.fracture_workers = bpy.props.IntProperty(name="fracture_workers", default=max(1, min(4, os.cpu_count() or 1)), min=1, max=64)
     bpy.types.Scene.mouse_object = bpy.props.EnumProperty(name="mouse_object", items=[("Cube", "Cube", "Cube", 'MESH_CUBE', 0), \
                                                                                          ("Sphere", "Sphere", "Sphere", 'MESH_UVSPHERE', 1), \
                                                                                          ("Custom", "Custom", "Custom", 'MESH_MONKEY', 2) ], default="Sphere")
@@ -2878,6 +3931,13 @@ def register():
     bpy.types.Scene.mouse_rings = bpy.props.IntProperty(name="mouse_segments", default=8, min=1, max=100)
     bpy.types.Scene.mouse_status = bpy.props.StringProperty(name="mouse_status", default="Start mouse based fracture")
     bpy.types.Scene.delete_helpers = bpy.props.BoolProperty(name="delete_helpers", default=False)
+    bpy.types.Scene.mouse_preview = bpy.props.BoolProperty(name="mouse_preview", default=True, 
+                                                           description="Preview the approximate helper points while dragging")
+    bpy.types.Scene.mouse_defer_refresh = bpy.props.BoolProperty(name="mouse_defer_refresh", default=False, 
+                                                                 description="Queue placed helpers and refracture once after idle time or on Enter")
+    bpy.types.Scene.mouse_refresh_delay = bpy.props.FloatProperty(name="mouse_refresh_delay", default=1.0, min=0.0, max=10.0, 
+                                                                  description="Idle seconds before queued helpers are refractured")
+    bpy.types.Scene.show_timescale_preview = bpy.props.BoolProperty(name="show_timescale_preview", default=False)
     bpy.types.Scene.time_scale = bpy.props.IntProperty(name="time_scale", default=100, step=1, min=0, max=200, subtype="PERCENTAGE", update=update_timescale)
     bpy.types.Scene.emit_start = bpy.props.IntProperty(name="emit_start", default=1, min=1, update=update_start_end)
     bpy.types.Scene.emit_end = bpy.props.IntProperty(name="emit_end", default=250, min=1, update=update_start_end)
@@ -2893,6 +3953,7 @@ def unregister():
     bpy.utils.unregister_class(MainOperationsPanel)
     bpy.utils.unregister_class(VIEW3D_SettingsPanel)
     bpy.utils.unregister_class(CombineSubObjectsOperator)
+    bpy.utils.unregister_class(ConnectorMembersOperator)
     bpy.utils.unregister_class(FractureFrameOperator)
     bpy.utils.unregister_class(TimingPanel)
     bpy.utils.unregister_class(FracturePathPanel)
@@ -2900,7 +3961,11 @@ def unregister():
     bpy.utils.unregister_class(FractureHelper)
     bpy.utils.unregister_class(ClusterHelperOperator)
     bpy.utils.unregister_class(DisplacementEdgesOperator)
+    bpy.utils.unregister_class(BackgroundFractureOperator)
+    bpy.utils.unregister_class(MergeTexturesOperator)
     bpy.utils.unregister_class(ViewOperatorFracture)
+    bpy.utils.unregister_class(BatchHelperOperator)
+    bpy.utils.unregister_class(HelperRecord)
     bpy.utils.unregister_class(SmokeSetupOperator)
     bpy.utils.unregister_class(DustSetupOperator)
     bpy.utils.unregister_class(DebrisSetupOperator)
@@ -2934,6 +3999,12 @@ def unregister():
         unregister_pie_keymaps()
     
     bpy.utils.unregister_class(FractureHelperPreferences)
+    
+    bpy.app.handlers.scene_update_post.remove(fracture_scene_update)
+    bpy.app.handlers.load_post.remove(fracture_clear_caches)
+    bpy.app.handlers.undo_post.remove(fracture_clear_caches)
+    bpy.app.handlers.redo_post.remove(fracture_clear_caches)
+    fracture_clear_caches(None)
          
        
     del bpy.types.Scene.use_animation_curve
@@ -2941,13 +4012,23 @@ def unregister():
     del bpy.types.Scene.animation_ghost
     del bpy.types.Scene.fracture_frame
     del bpy.types.Scene.is_dynamic
+    del bpy.types.Scene.use_bulk_keys
     del bpy.types.Scene.mouse_object
+    del bpy.types.Scene.helper_point_mode
+    del bpy.types.Scene.helper_point_count
+    del bpy.types.Scene.fracture_seed
+    del bpy.types.Scene.use_background_fracture
+    del bpy.types.Scene.fracture_workers
     del bpy.types.Scene.mouse_count
     del bpy.types.Scene.mouse_status
     del bpy.types.Scene.mouse_rings
     del bpy.types.Scene.mouse_segments
     del bpy.types.Scene.delete_helpers
+    del bpy.types.Scene.mouse_preview
+    del bpy.types.Scene.mouse_defer_refresh
+    del bpy.types.Scene.mouse_refresh_delay
     del bpy.types.Scene.time_scale
+    del bpy.types.Scene.show_timescale_preview
     del bpy.types.Scene.emit_start
     del bpy.types.Scene.emit_end
     del bpy.types.Scene.brush_fade